@@ -1,95 +1,212 @@
 from langchain.prompts import PromptTemplate
 from langchain.agents import Tool, AgentType, initialize_agent
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import AIMessage
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
 from dotenv import load_dotenv
+from chunking import CHUNK_SIZE, PAGE_BREAK, chunk_pages, fingerprint, merge_chunks
+from cache import ResponseCache
+from dedup import SIMILARITY_THRESHOLD, DocumentIndex, minhash
+from incremental import MAX_CHANGED_RATIO, StageStore, changed_ratio
+from registry import get_chain, get_llm, get_shared
+from prevalidate import MIN_WORDS, WORD, score_content
+from tokens import STAGE_BUDGETS, compress_text, count_tokens, fit_to_budget
+import difflib
+import itertools
+import logging
 import os
+import queue
+import re
+import threading
 import warnings
 
 load_dotenv()
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
+logger = logging.getLogger(__name__)
+
+# Maximum number of chunks processed concurrently in chunked mode
+MAX_WORKERS = int(os.getenv("MINI_COURSE_MAX_WORKERS", "4"))
+
+# "agent" runs the ReAct agent, "direct" runs the tools as a fixed chain
+PIPELINE_MODES = ("agent", "direct")
+PIPELINE_MODE = os.getenv("MINI_COURSE_PIPELINE_MODE", "agent")
+
+# Maximum number of improve/validate rounds in direct mode
+MAX_IMPROVE_ROUNDS = 2
+
+INVALID_VERDICT = re.compile(r"invalid\s+content", re.IGNORECASE)
+
+# Score content locally first and only call the validate LLM for the ambiguous middle band
+PREVALIDATE = os.getenv("MINI_COURSE_PREVALIDATE", "1") == "1"
+
+# Stages whose responses are cached on disk. Clean and validate are cached by default,
+# add "improve" and "generate" to also reuse generated output for repeat uploads
+CACHED_STAGES = set(os.getenv("MINI_COURSE_CACHED_STAGES", "clean,validate").split(","))
+
+response_cache = ResponseCache()
+
+# Clean/validate outputs per chunk fingerprint and the last run of each document
+stage_store = StageStore()
+
+# When set, the mini-course generator streams its tokens to this callable as they arrive
+token_sink = ContextVar("token_sink", default=None)
+
+
+# Run a prompt chain, serving the response from the cache when the stage is cached
+def run_chain(stage, prompt_template, llm, inputs, on_token=None):
+  # Keep the prompt within the stage's token budget, compressing the content locally if needed
+  inputs, prompt_tokens = fit_to_budget(stage, prompt_template, inputs, llm.model_name)
+  logger.info("%s: %d prompt tokens (budget %d)", stage, prompt_tokens, STAGE_BUDGETS[stage])
+
+  chain = get_chain(stage, prompt_template, llm)
+  key = None
+  if stage in CACHED_STAGES:
+    key = ResponseCache.make_key(stage, prompt_template.template, llm.model_name, llm.temperature, inputs)
+    cached = response_cache.get(key)
+    if cached is not None:
+      if on_token:
+        on_token(cached)
+      return AIMessage(content=cached)
+
+  if on_token:
+    parts = []
+    for chunk in chain.stream(inputs):
+      parts.append(chunk.content)
+      on_token(chunk.content)
+    result = AIMessage(content="".join(parts))
+  else:
+    result = chain.invoke(inputs)
+
+  if key:
+    response_cache.set(key, result.content)
+  return result
+
 # Tool 1: Content Cleaner
+CLEAN_PROMPT = PromptTemplate(
+  input_variables=["content"],
+  template=(
+    "You are an expert content cleaner. Your task is to clean the following text by removing any unrelated or unwanted data, "
+    "such as navigation links, advertisements, social media prompts, or footer text. Ensure the content is concise, focused, "
+    "and ready for further processing. Preserve the core content and structure while removing distractions.\n\n"
+    "Content:\n{content}\n\n"
+    "Return the cleaned content, ensuring it is well-structured and free of irrelevant elements."
+  ),
+)
+
 def clean_content_tool(raw_text):
-  prompt_template = PromptTemplate(
-    input_variables=["content"],
-    template=(
-            "You are an expert content cleaner. Your task is to clean the following text by removing any unrelated or unwanted data, "
-            "such as navigation links, advertisements, social media prompts, or footer text. Ensure the content is concise, focused, "
-            "and ready for further processing. Preserve the core content and structure while removing distractions.\n\n"
-            "Content:\n{content}\n\n"
-            "Return the cleaned content, ensuring it is well-structured and free of irrelevant elements."
-    ),
-  )
-  llm=ChatOpenAI(model="gpt-4o", temperature="0.3", api_key=os.getenv("OPENAI_API_KEY"))
-  chain = prompt_template | llm
-  return chain.invoke({"content": raw_text})
+  return run_chain("clean", CLEAN_PROMPT, get_llm("gpt-4o", 0.3), {"content": raw_text})
 
 
 # Tool 2: Content Validator
-def validate_content_tool(cleaned_text):
-  prompt_template = PromptTemplate(
-    input_variables=["content"],
-    template=(
-            "You are an expert content validator. Analyze the following text and determine if it is meaningful, well-structured, "
-            "and suitable for generating a mini-course. If the content is valid, return 'Valid Content' along with a brief summary "
-            "of why it is suitable. If the content is not valid, return 'Invalid Content' and provide actionable feedback on how "
-            "to improve it for mini-course generation.\n\n"
-            "Content:\n{content}\n\n"
-            "Validation Result:"
-    ),
-  ) 
-  llm=ChatOpenAI(model="gpt-4o", temperature=0.3, api_key=os.getenv("OPENAI_API_KEY"))
-  chain = prompt_template | llm
-  result = chain.invoke({"content": cleaned_text})
-
-  if "Invalid Content" in result:
-    feedback = result.split('Invalid Content:')[1].strip()
-    return {"valid": False, "feedback": feedback}
+VALIDATE_PROMPT = PromptTemplate(
+  input_variables=["content"],
+  template=(
+    "You are an expert content validator. Analyze the following text and determine if it is meaningful, well-structured, "
+    "and suitable for generating a mini-course. If the content is valid, return 'Valid Content' along with a brief summary "
+    "of why it is suitable. If the content is not valid, return 'Invalid Content' and provide actionable feedback on how "
+    "to improve it for mini-course generation.\n\n"
+    "Content:\n{content}\n\n"
+    "Validation Result:"
+  ),
+)
+
+# With chunk set, cleaned_text is one chunk of a larger document. The local length and junk rules
+# judge whole documents, so they never reject a chunk on their own
+def validate_content_tool(cleaned_text, chunk=False):
+  if chunk and len(WORD.findall(cleaned_text)) < MIN_WORDS:
+    # Too short to judge by itself, e.g. the closing paragraph of a document
+    return {"valid": True, "content": cleaned_text}
+  if PREVALIDATE:
+    local = score_content(cleaned_text)
+    logger.info("validate: local score %.3f -> %s", local["score"], local["verdict"])
+    if local["verdict"] == "valid":
+      return {"valid": True, "content": cleaned_text}
+    if local["verdict"] == "invalid" and not chunk:
+      return {"valid": False, "feedback": " ".join(local["reasons"]) or "The content is not suitable for a mini-course."}
+
+  result = run_chain("validate", VALIDATE_PROMPT, get_llm("gpt-4o", 0.3), {"content": cleaned_text}).content
+  return parse_validation(result, cleaned_text)
+
+
+# Parse the validator verdict, tolerating markdown emphasis and case changes
+def parse_validation(result, cleaned_text):
+  match = INVALID_VERDICT.search(result)
+  if match:
+    feedback = result[match.end():].lstrip(" *:-\n").strip()
+    return {"valid": False, "feedback": feedback or result.strip()}
   else:
     return {"valid": True, "content": cleaned_text}
   
 
 # Tool 3: Content improver
+IMPROVE_PROMPT = PromptTemplate(
+  input_variables=["content", "feedback"],
+  template=(
+    "You are an expert content editor. The following content has been deemed invalid for generating a mini-course. "
+    "Your task is to improve the content based on the provided feedback so that it becomes valid and suitable for mini-course generation.\n\n"
+    "Content:\n{content}\n\n"
+    "Feedback:\n{feedback}\n\n"
+    "Return the improved content, ensuring it is well-structured, meaningful, and ready for mini-course generation."
+  ),
+)
+
 def improve_content_tool(invalid_content, feedback):
-  prompt_template = PromptTemplate(
-    input_variables=["content", "feedback"],
-    template=(
-            "You are an expert content editor. The following content has been deemed invalid for generating a mini-course. "
-            "Your task is to improve the content based on the provided feedback so that it becomes valid and suitable for mini-course generation.\n\n"
-            "Content:\n{content}\n\n"
-            "Feedback:\n{feedback}\n\n"
-            "Return the improved content, ensuring it is well-structured, meaningful, and ready for mini-course generation."
-    ),
-  ) 
-  llm=ChatOpenAI(model="gpt-4o", temperature=0.3, api_key=os.getenv("OPENAI_API_KEY"))
-  chain = prompt_template | llm
-  return chain.invoke({"content": invalid_content, "feedback": feedback})
+  return run_chain("improve", IMPROVE_PROMPT, get_llm("gpt-4o", 0.3), {"content": invalid_content, "feedback": feedback})
 
 # Tool 4: Mini-course generator tool
+GENERATE_PROMPT = PromptTemplate(
+  input_variables=["content"],
+  template=(
+    "You are an professional course creator. Your task is to create a single, fully detailed, and publish-ready mini-course "
+    "from the following content. The mini-course should follow this structure:\n\n"
+    "1. **Title**: A concise and engaging title for the mini-course.\n"
+    "2. **Introduction**: A well detailed overview explaining the purpose of the mini-course and what learners will achieve.\n"
+    "3. **Key Learning Objectives**: A list of 3-5 specific, actionable objectives that learners will accomplish by the end of the mini-course.\n"
+    "4. **Detailed Content**: A well written, structured explanation of the topic, divided into sections with headings. Each section should include:\n"
+    "   - A heading for the section.\n"
+    "   - A detailed explanation of the topic.\n"
+    "   - Examples, practical applications, or actionable steps where relevant.\n"
+    "5. **Engagement Elements**: Suggest 1-2 interactive elements (e.g., activities, discussion prompts, or reflection questions) to engage learners and reinforce the material.\n"
+    "6. **Quiz**: Create a quiz with 5-7 questions based on the content. Include a mix of question types (e.g., multiple-choice, true/false, and short-answer questions). Ensure the questions are directly tied to the learning objectives.\n\n"
+    "Ensure the mini-course is grammatically correct, clear, professional, and ready for publishing and be detailed as possible. ALWAYS Return the mini-course in a structured markdown format.\n\n"
+    "Content:\n{content}\n\n"
+    "ALWAYS Return the mini-course in a structured format, clearly separating each section with headings and bullet points for easy readability."
+  ),
+)
+
 def mini_generator_tool(validated_text):
-  prompt_template = PromptTemplate(
-    input_variables=["content"],
-    template=(
-            "You are an professional course creator. Your task is to create a single, fully detailed, and publish-ready mini-course "
-            "from the following content. The mini-course should follow this structure:\n\n"
-            "1. **Title**: A concise and engaging title for the mini-course.\n"
-            "2. **Introduction**: A well detailed overview explaining the purpose of the mini-course and what learners will achieve.\n"
-            "3. **Key Learning Objectives**: A list of 3-5 specific, actionable objectives that learners will accomplish by the end of the mini-course.\n"
-            "4. **Detailed Content**: A well written, structured explanation of the topic, divided into sections with headings. Each section should include:\n"
-            "   - A heading for the section.\n"
-            "   - A detailed explanation of the topic.\n"
-            "   - Examples, practical applications, or actionable steps where relevant.\n"
-            "5. **Engagement Elements**: Suggest 1-2 interactive elements (e.g., activities, discussion prompts, or reflection questions) to engage learners and reinforce the material.\n"
-            "6. **Quiz**: Create a quiz with 5-7 questions based on the content. Include a mix of question types (e.g., multiple-choice, true/false, and short-answer questions). Ensure the questions are directly tied to the learning objectives.\n\n"
-            "Ensure the mini-course is grammatically correct, clear, professional, and ready for publishing and be detailed as possible. ALWAYS Return the mini-course in a structured markdown format.\n\n"
-            "Content:\n{content}\n\n"
-            "ALWAYS Return the mini-course in a structured format, clearly separating each section with headings and bullet points for easy readability."
-      ),
-  )
-  llm=ChatOpenAI(model="gpt-4o", temperature=0.7, api_key=os.getenv("OPENAI_API_KEY"))
-  chain = prompt_template | llm
-  return chain.invoke({"content": validated_text})
+  return run_chain("generate", GENERATE_PROMPT, get_llm("gpt-4o", 0.7), {"content": validated_text}, on_token=token_sink.get())
+
+
+# Delta regeneration: update a mini-course generated from a near-duplicate document
+UPDATE_PROMPT = PromptTemplate(
+  input_variables=["course", "content"],
+  template=(
+    "You are an professional course creator. The following mini-course was generated from an earlier version of a document. "
+    "The document has since changed as described below. Update the mini-course so it reflects the changes: add material for "
+    "added content, remove material that relied on removed content, and keep everything else, including the structure, exactly as it is.\n\n"
+    "Mini-course:\n{course}\n\n"
+    "Changes to the document:\n{content}\n\n"
+    "ALWAYS Return the complete updated mini-course in the same structured markdown format."
+  ),
+)
+
+def update_mini_course(previous_course, previous_text, new_text):
+  # Paragraphs keep their indentation, so changed code samples reach the prompt intact
+  old_paragraphs = [p for p in re.split(r"\n\s*\n", compress_text(previous_text)) if p.strip()]
+  new_paragraphs = [p for p in re.split(r"\n\s*\n", compress_text(new_text)) if p.strip()]
+  changes = [
+    f"{'Added' if line.startswith('+') else 'Removed'}: {line[2:]}"
+    for line in difflib.ndiff(old_paragraphs, new_paragraphs)
+    if line.startswith(("+ ", "- "))
+  ]
+  if not changes:
+    return previous_course
+  result = run_chain("update", UPDATE_PROMPT, get_llm("gpt-4o", 0.7),
+                     {"course": previous_course, "content": "\n\n".join(changes)}, on_token=token_sink.get())
+  return result.content.strip()
 
 
 # Define Tools for Agent
@@ -121,7 +238,7 @@ generate_mini_courses = Tool(
 # Init the Agent
 def create_agent():
   tools = [clean_content, validate_content, improve_content, generate_mini_courses]
-  llm = ChatOpenAI(model="gpt-4o", temperature=0.5, api_key=os.getenv("OPENAI_API_KEY"))
+  llm = get_llm("gpt-4o", 0.5)
 
   system_message = """You are an expert agent that processes raw content into mini-courses.
   CRITICAL INSTRUCTION: You must follow these steps exactly:
@@ -157,9 +274,120 @@ def create_agent():
 
   return agent
 
-# Wrapper to get the mini-course from the agent 
-def get_mini_course(raw_text):
-    agent = create_agent()
+
+# The agent is built once per process and shared by every caller and Streamlit session
+def get_agent():
+  return get_shared("agent", create_agent)
+
+# Map step: clean and validate one chunk, reusing the stored result of an unchanged chunk.
+# Returns (cleaned text, valid)
+def process_chunk(chunk):
+  chunk_fingerprint = fingerprint(chunk)
+  stored = stage_store.get_chunk(chunk_fingerprint)
+  if stored:
+    return stored
+
+  cleaned = clean_content_tool(chunk).content
+  valid = validate_content_tool(cleaned, chunk=True)["valid"]
+  stage_store.put_chunk(chunk_fingerprint, cleaned, valid)
+  return cleaned, valid
+
+
+# Chunked map-reduce pipeline for documents too large for a single prompt.
+# Accepts the text or a stream of pages; chunks are processed as soon as their pages arrive.
+# With a doc_key, a re-uploaded document only regenerates what changed since its last run,
+# unless force is set, in which case the course is generated from scratch and stored as the new run
+def get_chunked_mini_course(raw_text, chunk_size=CHUNK_SIZE, max_workers=MAX_WORKERS, doc_key=None, force=False):
+  pages = raw_text.split(PAGE_BREAK) if isinstance(raw_text, str) else raw_text
+  chunks = []
+  with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    futures = []
+    for chunk in chunk_pages(pages, chunk_size):
+      chunks.append(chunk)
+      # Run in a copy of the caller's context so callbacks such as token counters see the chunk calls
+      futures.append(executor.submit(copy_context().run, process_chunk, chunk))
+    processed = [future.result() for future in futures]
+
+  # Keep the cleaned content even if every chunk was rejected, generation is better than nothing
+  kept = [cleaned for cleaned, valid in processed if valid] or [cleaned for cleaned, _ in processed]
+  content = merge_chunks(kept)
+  fingerprints = [fingerprint(chunk) for chunk in chunks]
+
+  previous = stage_store.get_document(doc_key) if doc_key and not force else None
+  if previous and previous["content"] == content:
+    result = previous["mini_course"]
+  elif previous and changed_ratio(previous["fingerprints"], fingerprints) <= MAX_CHANGED_RATIO:
+    result = update_mini_course(previous["mini_course"], previous["content"], content)
+  else:
+    result = mini_generator_tool(content).content
+
+  if result and result.strip():
+    if doc_key:
+      stage_store.put_document(doc_key, fingerprints, content, result.strip())
+    return result.strip()
+  return "Error: Could not generate mini-course content. Please try again."
+
+
+# Direct pipeline: clean -> validate -> (improve) -> generate, without the agent loop
+def get_direct_mini_course(raw_text, max_improve_rounds=MAX_IMPROVE_ROUNDS):
+  content = clean_content_tool(raw_text).content
+  validation = validate_content_tool(content)
+
+  # Improve only invalid content, and stop after a fixed number of rounds
+  rounds = 0
+  while not validation["valid"] and rounds < max_improve_rounds:
+    content = improve_content_tool(content, validation["feedback"]).content
+    validation = validate_content_tool(content)
+    rounds += 1
+
+  result = mini_generator_tool(content).content
+  if result and result.strip():
+    return result.strip()
+  return "Error: Could not generate mini-course content. Please try again."
+
+
+# Read pages until the document is known to need more than one chunk. Short documents are
+# joined into a string, long ones stay a page stream for the chunked pipeline
+def peek_pages(pages, chunk_size=CHUNK_SIZE):
+  pages = iter(pages)
+  head = []
+  size = 0
+  for page in pages:
+    head.append(page)
+    size += len(page)
+    if size > chunk_size:
+      return itertools.chain(head, pages)
+  return PAGE_BREAK.join(head)
+
+
+# Wrapper to get the mini-course from the agent. raw_text is the document text or an
+# iterable of its pages, such as utils.process_file_pages
+def get_mini_course(raw_text, pipeline_mode=None, chunked=None, chunk_size=CHUNK_SIZE, max_workers=MAX_WORKERS, doc_key=None, force=False):
+    pipeline_mode = pipeline_mode or PIPELINE_MODE
+    if pipeline_mode not in PIPELINE_MODES:
+        raise ValueError(f"Unknown pipeline mode '{pipeline_mode}'. Use one of: {', '.join(PIPELINE_MODES)}")
+
+    if not isinstance(raw_text, str):
+        raw_text = peek_pages(raw_text, chunk_size) if chunked is not False else PAGE_BREAK.join(raw_text)
+
+    # Large documents, and documents with a stored previous run, go through the chunked pipeline unless told otherwise
+    if chunked is None:
+        chunked = (
+            not isinstance(raw_text, str)
+            or len(raw_text) > chunk_size
+            or bool(doc_key and stage_store.get_document(doc_key))
+        )
+    if chunked:
+        return get_chunked_mini_course(raw_text, chunk_size=chunk_size, max_workers=max_workers, doc_key=doc_key, force=force)
+
+    if pipeline_mode == "direct":
+        return get_direct_mini_course(raw_text)
+
+    # The agent re-reads its input on every step, so compress it when it is over budget
+    if count_tokens(raw_text) > STAGE_BUDGETS["agent"]:
+        raw_text = compress_text(raw_text)
+
+    agent = get_agent()
     result = agent(
         {
             "input": f"""Process this content into a mini-course. 
@@ -180,6 +408,78 @@ def get_mini_course(raw_text):
     return "Error: Could not generate mini-course content. Please try again."
 
 
+# Processed documents and their mini-courses, for reusing work on near-duplicate uploads
+document_index = DocumentIndex()
+
+
+# Find a previously processed document similar to this one, if any
+def find_similar_course(raw_text, threshold=SIMILARITY_THRESHOLD):
+  match = document_index.query(minhash(compress_text(raw_text)), threshold)
+  if match is None:
+    return None
+  doc_id, similarity = match
+  return dict(document_index.get(doc_id), similarity=similarity)
+
+
+# Record a processed document so later near-duplicates can reuse its mini-course, and its stored run
+def remember_course(raw_text, mini_course, source=None, doc_key=None):
+  text = compress_text(raw_text)
+  return document_index.add(text, mini_course, source, signature=minhash(text), doc_key=doc_key)
+
+
+# Whether a document has a stored run that a re-upload can be updated from
+def has_stored_run(doc_key):
+  return bool(doc_key and stage_store.get_document(doc_key))
+
+
+# Stream the result of a pipeline function as it is generated. The function runs in a worker
+# thread and the generation stage pushes its tokens here, so this works for every pipeline mode.
+# The agent may call the generator more than once, so the streamed tokens are for display only
+# and result holds the function's return value once iteration ends
+class StreamedCall:
+  def __init__(self, func, *args, **kwargs):
+    self.func = func
+    self.args = args
+    self.kwargs = kwargs
+    self.result = None
+
+  def __iter__(self):
+    tokens = queue.Queue()
+    outcome = {}
+
+    def run():
+      token_sink.set(tokens.put)
+      try:
+        outcome["result"] = self.func(*self.args, **self.kwargs)
+      except Exception as e:
+        outcome["error"] = e
+      finally:
+        tokens.put(None)
+
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+
+    streamed = False
+    while (token := tokens.get()) is not None:
+      streamed = True
+      yield token
+    worker.join()
+
+    if "error" in outcome:
+      raise outcome["error"]
+    self.result = outcome["result"]
+    # Nothing was streamed (e.g. the agent never reached the generator), show the final answer
+    if not streamed:
+      yield self.result
+
+
+def stream_call(func, *args, **kwargs):
+  return StreamedCall(func, *args, **kwargs)
+
+
+def stream_mini_course(raw_text, **kwargs):
+  return stream_call(get_mini_course, raw_text, **kwargs)
+
 
 # To test the agent
 # def main():
@@ -1,13 +1,78 @@
 import streamlit as st
 from utils import process_file, process_url
-from agent import create_agent, get_mini_course
-
-agent = create_agent()
+from crawl import process_site
+from chunking import fingerprint
+from agent import find_similar_course, get_agent, has_stored_run, remember_course, stream_call, stream_mini_course, update_mini_course
+from registry import startup_report
+
+
+# Build the agent once per process and share it across reruns and sessions
+@st.cache_resource
+def load_agent():
+  agent = get_agent()
+  print(startup_report())
+  return agent
+
+agent = load_agent()
+
+
+# Generate the mini-course for a document, offering the course of a near-duplicate document
+# processed earlier. doc_key identifies the document's stored run, source is shown to the user.
+# Documents without a stable name (uploads) pass no doc_key and take the one of the near-duplicate
+# they match, so an edited re-upload is updated from its previous run.
+# Returns True when the course was streamed to the page during this run
+def generate_mini_course(key, content, source, doc_key=None):
+  similar_key = f"similar_{key}"
+  if similar_key not in st.session_state:
+    st.session_state[similar_key] = find_similar_course(content)
+  similar = st.session_state[similar_key]
+  if doc_key is None:
+    doc_key = (similar and similar["doc_key"]) or f"upload:{fingerprint(content)}"
+
+  action = "generate"
+  if similar:
+    st.info(f"This document is {similar['similarity']:.0%} similar to '{similar['source']}', which was processed before.")
+    reuse, update, regenerate = st.columns(3)
+    if reuse.button("Use existing mini-course"):
+      action = "reuse"
+    elif update.button("Update existing mini-course"):
+      action = "update"
+    elif regenerate.button("Generate from scratch"):
+      action = "regenerate"
+    else:
+      return False
+
+  if action == "reuse":
+    st.session_state[key] = similar["mini_course"]
+    return False
+
+  st.info("Generating the final mini-course...")
+  # With a stored run, only the changed chunks are cleaned and validated again. Otherwise the
+  # near-duplicate's course is updated from a paragraph diff
+  if action == "update" and not (similar["doc_key"] == doc_key and has_stored_run(doc_key)):
+    stream = stream_call(update_mini_course, similar["mini_course"], similar["text"], content)
+  else:
+    # An explicit regenerate skips the stored run of this document instead of returning it
+    stream = stream_mini_course(content, doc_key=doc_key, force=action == "regenerate")
+  # Render the mini-course as it streams in, then replace it with the completed text, which is
+  # what is kept for reruns. The stream may hold several drafts if the agent generated more than once
+  placeholder = st.empty()
+  with placeholder:
+    st.write_stream(stream)
+  mini_course = stream.result
+  placeholder.markdown(mini_course)
+  if not mini_course.startswith("Error:"):
+    remember_course(content, mini_course, source, doc_key)
+  st.session_state[key] = mini_course
+  return True
 
 st.title("Mini-Course Generator Agent")
 
 st.sidebar.header("Input Options")
-input_option = st.sidebar.radio("Choose Input Type:", ("Upload a file", "Enter a document URL"))
+input_option = st.sidebar.radio("Choose Input Type:", ("Upload a file", "Enter a document URL", "Enter a blog series or docs section"))
+
+with st.sidebar.expander("Startup timing"):
+  st.text(startup_report())
 
 if input_option == "Upload a file":
   uploaded_file = st.file_uploader("Upload a PDF or TXT file", type=["pdf", "txt"])
@@ -15,26 +80,26 @@ if input_option == "Upload a file":
 
     # Creating a session date do when i hit download button it doesn't reprocess
     file_key = f"mini_course_{uploaded_file.name}"
+    streamed = False
+    content_key = f"content_{uploaded_file.name}"
     if file_key not in st.session_state:
-
-      with st.spinner("Processing file..."):
-        try: 
-          st.info("Extracting content from the uploaded file...")
-          content = process_file(uploaded_file)
-
-
-          st.info("Generating the final mini-course...")
-          mini_course = get_mini_course(content)
-
-          st.session_state[file_key] = mini_course
-        except Exception as e:
-          st.error(f"Error processing file: {str(e)}") 
-          st.session_state[file_key] = ""
+      try: 
+        if content_key not in st.session_state:
+          with st.spinner("Processing file..."):
+            st.info("Extracting content from the uploaded file...")
+            st.session_state[content_key] = process_file(uploaded_file)
+
+        # File names are not unique across uploads, so the stored run is found through the near-duplicate match
+        streamed = generate_mini_course(file_key, st.session_state[content_key], uploaded_file.name)
+      except Exception as e:
+        st.error(f"Error processing file: {str(e)}") 
+        st.session_state[file_key] = ""
 
     mini_course = st.session_state.get(file_key, "")
     if mini_course:
       st.success("Mini courses created!")
-      st.text_area("Generated mini-course", mini_course, height=400)
+      if not streamed:
+        st.markdown(mini_course)
       st.download_button(
         label="Download Mini-Course",
         data=mini_course,
@@ -50,6 +115,7 @@ elif input_option == "Enter a document URL":
 
     # Use URL as file key
     url_key = f"mini_course_{url}"
+    streamed = False
 
     # Validate if the url is a google docs link
     if "doc.google.com" in url: 
@@ -57,27 +123,62 @@ elif input_option == "Enter a document URL":
     elif "www.notion.so" in url:
       st.error('Notion links are not supported. Enter a blog post URL.')
     else: 
+      content_key = f"content_{url}"
       if url_key not in st.session_state:
-        with st.spinner("Fetching and processing content..."):
-          try:
-            st.info("Extracting content from the URL...")
-            content = process_url(url)
-
-
-            st.info("Generating the final mini-course...")
-            mini_course = get_mini_course(content)
-            st.session_state[url_key] = mini_course
-          except Exception as e:
-            st.error(f"Error processing URL: {str(e)}")
-            st.session_state[url_key] = ""
+        try:
+          if content_key not in st.session_state:
+            with st.spinner("Fetching and processing content..."):
+              st.info("Extracting content from the URL...")
+              st.session_state[content_key] = process_url(url)
+
+          streamed = generate_mini_course(url_key, st.session_state[content_key], url, f"url:{url}")
+        except Exception as e:
+          st.error(f"Error processing URL: {str(e)}")
+          st.session_state[url_key] = ""
       
       mini_course =st.session_state.get(url_key, "")
       if mini_course:
         st.success("Mini courses created!")
-        st.text_area("Generated Mini-course", mini_course, height=400)
+        if not streamed:
+          st.markdown(mini_course)
         st.download_button(
           label="Download Mini-course",
           data=mini_course,
           file_name="mini_course.md",
           mime="text/markdown",
         )
+
+
+elif input_option == "Enter a blog series or docs section":
+  st.info("Enter a sitemap URL, an index page whose links in the same section should be followed, or a list of URLs (one per line). Up to 50 pages are combined into one mini-course.")
+  urls = [line.strip() for line in st.text_area("Enter the URLs").splitlines() if line.strip()]
+  if urls:
+
+    source = urls[0] if len(urls) == 1 else urls
+    site_key = f"mini_course_{' '.join(urls)}"
+    content_key = f"content_{' '.join(urls)}"
+    streamed = False
+    if site_key not in st.session_state:
+      try:
+        if content_key not in st.session_state:
+          with st.spinner("Fetching and processing pages..."):
+            st.info("Extracting content from the pages...")
+            st.session_state[content_key] = process_site(source)
+
+        # Prefixed by mode, so a site given by its index URL and that single page keep separate runs
+        streamed = generate_mini_course(site_key, st.session_state[content_key], urls[0], "site:" + "\n".join(urls))
+      except Exception as e:
+        st.error(f"Error processing URLs: {str(e)}")
+        st.session_state[site_key] = ""
+
+    mini_course = st.session_state.get(site_key, "")
+    if mini_course:
+      st.success("Mini courses created!")
+      if not streamed:
+        st.markdown(mini_course)
+      st.download_button(
+        label="Download Mini-course",
+        data=mini_course,
+        file_name="mini_course.md",
+        mime="text/markdown",
+      )
@@ -0,0 +1,146 @@
+import argparse
+import hashlib
+import io
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from langchain_community.callbacks import get_openai_callback
+from agent import PIPELINE_MODES, get_mini_course
+from utils import process_file_pages, process_url
+
+MIME_TYPES = {".pdf": "application/pdf", ".txt": "text/plain"}
+
+
+class LocalFile(io.BytesIO):
+  """
+  A file from disk with the name and type attributes of a Streamlit upload,
+  so it can be passed to process_file_pages.
+  """
+
+  def __init__(self, path):
+    with open(path, "rb") as f:
+      super().__init__(f.read())
+    self.name = os.path.basename(path)
+    self.type = MIME_TYPES[os.path.splitext(path)[1].lower()]
+
+
+class RateLimiter:
+  """
+  Spaces out document starts to at most per_minute per minute across all workers.
+  """
+
+  def __init__(self, per_minute):
+    self.interval = 60.0 / per_minute if per_minute else 0.0
+    self.next_start = time.monotonic()
+    self._lock = threading.Lock()
+
+  def wait(self):
+    if not self.interval:
+      return
+    with self._lock:
+      now = time.monotonic()
+      start = max(now, self.next_start)
+      self.next_start = start + self.interval
+    time.sleep(max(0.0, start - now))
+
+
+def collect_jobs(input_dir=None, url_file=None):
+  """
+  Lists the documents to convert as (source, output name) pairs.
+  Args:
+      input_dir: Folder searched recursively for PDF and TXT files.
+      url_file: File with one URL per line, blank lines and # comments are ignored.
+  Returns:
+      list: (source, output name) pairs in a stable order.
+  """
+  jobs = []
+  if input_dir:
+    for root, _, filenames in os.walk(input_dir):
+      for filename in sorted(filenames):
+        if os.path.splitext(filename)[1].lower() in MIME_TYPES:
+          path = os.path.join(root, filename)
+          name = os.path.splitext(os.path.relpath(path, input_dir))[0].replace(os.sep, "__")
+          jobs.append((path, name + ".md"))
+  if url_file:
+    with open(url_file, "r", encoding="utf-8") as f:
+      for line in f:
+        url = line.strip()
+        if url and not url.startswith("#"):
+          slug = re.sub(r"[^A-Za-z0-9]+", "-", url.split("://", 1)[-1]).strip("-")[:80]
+          digest = hashlib.sha1(url.encode("utf-8")).hexdigest()[:8]
+          jobs.append((url, f"{slug}-{digest}.md"))
+  return jobs
+
+
+def convert(source, output_path, pipeline_mode, limiter):
+  """
+  Generates one mini-course and writes it to output_path.
+  Returns:
+      int: Tokens used by the document.
+  """
+  limiter.wait()
+  with get_openai_callback() as cb:
+    if source.startswith(("http://", "https://")):
+      content = process_url(source)
+      doc_key = f"url:{source}"
+    else:
+      content = process_file_pages(LocalFile(source))
+      doc_key = f"file:{os.path.abspath(source)}"
+    mini_course = get_mini_course(content, pipeline_mode=pipeline_mode, doc_key=doc_key)
+
+  if mini_course.startswith("Error:"):
+    raise RuntimeError(mini_course)
+
+  # Write to a temporary file first so a crash never leaves a partial output behind
+  tmp_path = output_path + ".tmp"
+  with open(tmp_path, "w", encoding="utf-8") as f:
+    f.write(mini_course)
+  os.replace(tmp_path, output_path)
+  return cb.total_tokens
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Generate mini-courses for a folder of documents or a list of URLs.")
+  parser.add_argument("--input-dir", help="Folder of PDF/TXT files (searched recursively)")
+  parser.add_argument("--urls", help="File with one URL per line")
+  parser.add_argument("--output-dir", required=True, help="Folder the .md mini-courses are written to")
+  parser.add_argument("--workers", type=int, default=4, help="Documents processed concurrently")
+  parser.add_argument("--rate-limit", type=float, default=0, help="Maximum documents started per minute (0 = unlimited)")
+  parser.add_argument("--mode", choices=PIPELINE_MODES, default="direct", help="Pipeline mode passed to get_mini_course")
+  args = parser.parse_args()
+  if not args.input_dir and not args.urls:
+    parser.error("Pass --input-dir, --urls or both.")
+
+  os.makedirs(args.output_dir, exist_ok=True)
+  jobs = collect_jobs(args.input_dir, args.urls)
+
+  # Resume: outputs written by a previous run are skipped
+  pending = [(source, os.path.join(args.output_dir, name)) for source, name in jobs]
+  pending = [(source, path) for source, path in pending if not os.path.exists(path)]
+  print(f"{len(jobs)} documents, {len(jobs) - len(pending)} already done, {len(pending)} to generate")
+
+  limiter = RateLimiter(args.rate_limit)
+  done = failed = tokens = 0
+  start = time.perf_counter()
+  with ThreadPoolExecutor(max_workers=args.workers) as executor:
+    futures = {executor.submit(convert, source, path, args.mode, limiter): source for source, path in pending}
+    for future in as_completed(futures):
+      source = futures[future]
+      try:
+        tokens += future.result()
+        done += 1
+        print(f"[{done + failed}/{len(pending)}] done: {source}")
+      except Exception as e:
+        failed += 1
+        print(f"[{done + failed}/{len(pending)}] failed: {source}: {e}")
+
+  minutes = (time.perf_counter() - start) / 60
+  print(f"\nGenerated {done} mini-courses, {failed} failed, in {minutes:.1f} min")
+  if minutes > 0:
+    print(f"Throughput: {done / minutes:.2f} docs/min, {tokens / minutes:,.0f} tokens/min")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,62 @@
+import argparse
+import logging
+import time
+from langchain_community.callbacks import get_openai_callback
+from agent import PIPELINE_MODES, get_mini_course, response_cache
+from tokens import usage
+
+
+def measure_mini_course(raw_text, pipeline_mode):
+  """
+  Generates one mini-course and records its cost.
+  Args:
+      raw_text: The document text.
+      pipeline_mode: One of PIPELINE_MODES.
+  Returns:
+      dict: LLM calls, token counts and latency for the run.
+  """
+  start = time.perf_counter()
+  with get_openai_callback() as cb:
+    get_mini_course(raw_text, pipeline_mode=pipeline_mode, chunked=False)
+  return {
+    "mode": pipeline_mode,
+    "llm_calls": cb.successful_requests,
+    "prompt_tokens": cb.prompt_tokens,
+    "completion_tokens": cb.completion_tokens,
+    "total_tokens": cb.total_tokens,
+    "cost_usd": cb.total_cost,
+    "seconds": time.perf_counter() - start,
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Compare LLM calls, tokens and latency per mini-course for each pipeline mode.")
+  parser.add_argument("files", nargs="+", help="Text files to generate mini-courses from")
+  parser.add_argument("--modes", nargs="+", default=list(PIPELINE_MODES), choices=PIPELINE_MODES)
+  parser.add_argument("--log-tokens", action="store_true", help="Log the prompt token count of every call")
+  args = parser.parse_args()
+  if args.log_tokens:
+    logging.basicConfig(level=logging.INFO, format="%(name)s: %(message)s")
+
+  print(f"{'file':30} {'mode':8} {'calls':>6} {'prompt':>8} {'compl.':>8} {'total':>8} {'cost $':>8} {'secs':>7}")
+  for path in args.files:
+    with open(path, "r", encoding="utf-8") as f:
+      raw_text = f.read()
+    for mode in args.modes:
+      stats = measure_mini_course(raw_text, mode)
+      print(
+        f"{path[-30:]:30} {stats['mode']:8} {stats['llm_calls']:>6} {stats['prompt_tokens']:>8} "
+        f"{stats['completion_tokens']:>8} {stats['total_tokens']:>8} {stats['cost_usd']:>8.4f} {stats['seconds']:>7.1f}"
+      )
+
+  print("\nPrompt tokens by stage:")
+  for stage, counts in usage.items():
+    print(f"  {stage:10} {counts['calls']:>4} calls {counts['prompt_tokens']:>9} tokens")
+
+  cache_stats = response_cache.stats()
+  print(f"\nResponse cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+        f"{cache_stats['entries']} entries ({cache_stats['bytes'] / 1024:.0f} KB)")
+
+
+if __name__ == "__main__":
+  main()
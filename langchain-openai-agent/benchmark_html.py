@@ -0,0 +1,59 @@
+import argparse
+import importlib.util
+import os
+import time
+from bs4 import BeautifulSoup
+from utils import CONTENT_TAGS, extract_html_text
+
+
+def extract_full_dom(html):
+  """
+  The original extraction: parse the whole DOM with html.parser.
+  """
+  page_content = BeautifulSoup(html, "html.parser")
+  return "\n\n".join(tag.get_text(strip=True) for tag in page_content.find_all(CONTENT_TAGS))
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Compare HTML extraction speed over a folder of saved pages.")
+  parser.add_argument("folder", help="Folder of saved .html/.htm pages")
+  parser.add_argument("--repeat", type=int, default=3, help="Times each page is parsed per method")
+  args = parser.parse_args()
+
+  pages = []
+  for filename in sorted(os.listdir(args.folder)):
+    if filename.endswith((".html", ".htm")):
+      with open(os.path.join(args.folder, filename), "r", encoding="utf-8", errors="replace") as f:
+        pages.append(f.read())
+  if not pages:
+    print("No .html files found.")
+    return
+
+  methods = {
+    "html.parser (full DOM)": extract_full_dom,
+    "html.parser + strainer": lambda html: extract_html_text(html, "html.parser"),
+  }
+  if importlib.util.find_spec("lxml"):
+    methods["lxml + strainer"] = lambda html: extract_html_text(html, "lxml")
+
+  baseline = [extract_full_dom(html) for html in pages]
+  total_mb = sum(len(html.encode("utf-8")) for html in pages) / (1024 * 1024)
+  print(f"{len(pages)} pages, {total_mb:.1f} MB, {args.repeat} repeats\n")
+  print(f"{'method':26} {'ms/page':>9} {'MB/s':>8} {'speedup':>8} {'same output':>12}")
+
+  baseline_seconds = None
+  for name, extract in methods.items():
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+      outputs = [extract(html) for html in pages]
+    seconds = (time.perf_counter() - start) / args.repeat
+    baseline_seconds = baseline_seconds or seconds
+    same = sum(output == expected for output, expected in zip(outputs, baseline))
+    print(
+      f"{name:26} {seconds * 1000 / len(pages):>9.2f} {total_mb / seconds:>8.1f} "
+      f"{baseline_seconds / seconds:>7.1f}x {same:>7}/{len(pages)}"
+    )
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_PATH = os.getenv("MINI_COURSE_CACHE_PATH", os.path.join(".cache", "responses.sqlite"))
+CACHE_MAX_BYTES = int(float(os.getenv("MINI_COURSE_CACHE_MAX_MB", "256")) * 1024 * 1024)
+
+
+class ResponseCache:
+  """
+  Content-addressed, disk-backed cache of LLM responses.
+  Entries are stored in SQLite and evicted least recently used first once
+  the total size of cached responses goes over max_bytes.
+  """
+
+  def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+    self.path = path
+    self.max_bytes = max_bytes
+    self.hits = 0
+    self.misses = 0
+    self._lock = threading.Lock()
+
+    directory = os.path.dirname(path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    self._conn = sqlite3.connect(path, check_same_thread=False)
+    self._conn.execute(
+      "CREATE TABLE IF NOT EXISTS responses ("
+      "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+    )
+    self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+    self._conn.commit()
+
+  @staticmethod
+  def make_key(tool, template, model, temperature, inputs):
+    """
+    Hashes everything that determines a response into a cache key.
+    Args:
+        tool: Name of the tool making the call.
+        template: The prompt template string.
+        model: The model name.
+        temperature: The sampling temperature.
+        inputs: Dict of prompt input variables.
+    Returns:
+        str: Hex SHA-256 digest.
+    """
+    payload = json.dumps(
+      {"tool": tool, "template": template, "model": model, "temperature": float(temperature), "inputs": inputs},
+      sort_keys=True,
+      ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+  def get(self, key):
+    with self._lock:
+      row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+      if row is None:
+        self.misses += 1
+        return None
+      self.hits += 1
+      self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+      self._conn.commit()
+      return row[0]
+
+  def set(self, key, value):
+    size = len(value.encode("utf-8"))
+    if size > self.max_bytes:
+      return
+    with self._lock:
+      self._conn.execute(
+        "INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+        (key, value, size, time.time()),
+      )
+      self._evict()
+      self._conn.commit()
+
+  def _evict(self):
+    total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    if total <= self.max_bytes:
+      return
+    for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+      self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+      total -= size
+      if total <= self.max_bytes:
+        break
+
+  def clear(self):
+    with self._lock:
+      self._conn.execute("DELETE FROM responses")
+      self._conn.commit()
+
+  def stats(self):
+    """
+    Returns:
+        dict: Hit/miss counters for this process and the size of the cache on disk.
+    """
+    with self._lock:
+      entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+    lookups = self.hits + self.misses
+    return {
+      "hits": self.hits,
+      "misses": self.misses,
+      "hit_rate": self.hits / lookups if lookups else 0.0,
+      "entries": entries,
+      "bytes": total,
+    }
@@ -0,0 +1,167 @@
+import hashlib
+import re
+
+# Separator placed between PDF pages by process_file
+PAGE_BREAK = "\f"
+
+# Default chunk size in characters (~3k tokens), small enough for fast parallel calls
+CHUNK_SIZE = 12000
+
+# Content-defined chunk boundaries: a chunk may end before a section whose hash is divisible by
+# BOUNDARY_MODULUS once it holds at least MIN_CHUNK_RATIO of max_chars. Boundaries then depend
+# on the sections themselves rather than on offsets or pages, so an edit only changes the chunks
+# it touches
+BOUNDARY_MODULUS = 4
+MIN_CHUNK_RATIO = 0.25
+# Paragraphs that do not start a section are this many times less likely to be a boundary
+PARAGRAPH_BOUNDARY_FACTOR = 4
+
+# A new section starts at a markdown heading, a numbered heading ("2.1 Title") or an ALL CAPS line
+SECTION_BOUNDARY = re.compile(
+  r"\n(?=#{1,6} |\d+(?:\.\d+)*\.? +[A-Z][^\n]{0,80}\n|[A-Z][A-Z0-9 ,:&'-]{3,80}\n)"
+)
+
+# Blank lines between paragraphs
+PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n\s*")
+
+
+def _section_blocks(text):
+  """
+  Splits text into section blocks, in document order.
+  """
+  return [section.strip() for section in SECTION_BOUNDARY.split(text) if section.strip()]
+
+
+def _starts_section(block):
+  return SECTION_BOUNDARY.match(f"\n{block}\n") is not None
+
+
+def _join_page(text, page):
+  """
+  Appends a page, adding a line break only where the page break was the only separator,
+  so the joined text does not depend on where the pages were cut.
+  """
+  if not text or not page or text[-1].isspace() or page[0].isspace():
+    return text + page
+  return f"{text}\n{page}"
+
+
+def _blocks(pages):
+  """
+  Yields the paragraphs of a stream of pages, headings starting their own block, as soon
+  as each one is complete. Page breaks are only line breaks here, so the blocks of a
+  document stay the same when an edit reflows its pages.
+  """
+  pending = ""
+  for page in pages:
+    pending = _join_page(pending, page)
+    *complete, pending = PARAGRAPH_BREAK.split(pending)
+    for paragraph in complete:
+      yield from _section_blocks(paragraph)
+  yield from _section_blocks(pending)
+
+
+def _split_oversized(block, max_chars):
+  """
+  Splits a block larger than max_chars on paragraphs, then lines, then hard cuts.
+  """
+  for separator in ("\n\n", "\n"):
+    parts = [part for part in block.split(separator) if part.strip()]
+    if len(parts) > 1:
+      return list(_pack(parts, max_chars, separator, content_defined=True))
+  return [block[i:i + max_chars] for i in range(0, len(block), max_chars)]
+
+
+def fingerprint(text):
+  """
+  Returns a stable fingerprint of a section or chunk, insensitive to whitespace, including
+  the line breaks left where page breaks fell.
+  """
+  return hashlib.sha256("".join(text.split()).encode("utf-8")).hexdigest()
+
+
+def _is_boundary(block):
+  """
+  Whether a chunk may end before block. Section starts are likelier boundaries than paragraphs.
+  """
+  modulus = BOUNDARY_MODULUS if _starts_section(block) else BOUNDARY_MODULUS * PARAGRAPH_BOUNDARY_FACTOR
+  return int(fingerprint(block)[:8], 16) % modulus == 0
+
+
+def _pack(blocks, max_chars, separator="\n\n", content_defined=False):
+  """
+  Greedily packs consecutive blocks into chunks of at most max_chars, yielding
+  each chunk as soon as it is full. With content_defined, chunks holding at least
+  min_chars also end before a content-defined boundary block.
+  """
+  min_chars = int(max_chars * MIN_CHUNK_RATIO)
+  current = ""
+  for block in blocks:
+    if len(block) > max_chars:
+      if current:
+        yield current
+        current = ""
+      yield from _split_oversized(block, max_chars)
+      continue
+    if content_defined and len(current) >= min_chars and _is_boundary(block):
+      yield current
+      current = ""
+    if current and len(current) + len(separator) + len(block) > max_chars:
+      yield current
+      current = block
+    else:
+      current = f"{current}{separator}{block}" if current else block
+  if current:
+    yield current
+
+
+def chunk_pages(pages, max_chars=CHUNK_SIZE):
+  """
+  Packs a stream of pages into chunks split on section and paragraph boundaries.
+  Chunk boundaries are content-defined and ignore where the page breaks fall, so editing
+  one section leaves the other chunks unchanged even when it reflows the later pages.
+  Chunks are yielded as soon as they are complete, so processing can start before the
+  rest of the document has been extracted.
+  Args:
+      pages: Iterable of page texts in document order.
+      max_chars: Maximum size of a chunk in characters.
+  Returns:
+      generator: Chunks in document order, each at most max_chars long.
+  """
+  return _pack(_blocks(pages), max_chars, content_defined=True)
+
+
+def split_into_chunks(text, max_chars=CHUNK_SIZE):
+  """
+  Splits a document into chunks on section and paragraph boundaries.
+  Args:
+      text: The extracted document text.
+      max_chars: Maximum size of a chunk in characters.
+  Returns:
+      list: Chunks in document order, each at most max_chars long.
+  """
+  return list(chunk_pages(text.split(PAGE_BREAK), max_chars))
+
+
+def _normalize(paragraph):
+  return " ".join(paragraph.lower().split())
+
+
+def merge_chunks(chunks):
+  """
+  Merges processed chunks back into one document, dropping repeated paragraphs
+  such as running headers, footers and content duplicated across pages.
+  Args:
+      chunks: Processed chunk texts in document order.
+  Returns:
+      str: The merged, deduplicated content.
+  """
+  seen = set()
+  paragraphs = []
+  for chunk in chunks:
+    for paragraph in re.split(r"\n\s*\n", chunk):
+      key = _normalize(paragraph)
+      if key and key not in seen:
+        seen.add(key)
+        paragraphs.append(paragraph.strip())
+  return "\n\n".join(paragraphs)
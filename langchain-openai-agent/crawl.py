@@ -0,0 +1,137 @@
+import asyncio
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urldefrag, urljoin, urlparse
+from bs4 import BeautifulSoup, SoupStrainer
+from chunking import PAGE_BREAK
+from utils import HTML_PARSER, extract_html_text, fetch_url
+
+# Maximum pages fetched for one course, and concurrent connections per host
+MAX_PAGES = 50
+PER_HOST_LIMIT = 6
+
+
+def parse_sitemap(xml_text):
+  """
+  Lists the page URLs of a sitemap and the child sitemaps of a sitemap index.
+  Returns:
+      tuple: (page URLs, child sitemap URLs) in document order.
+  """
+  root = ET.fromstring(xml_text.encode("utf-8"))
+  pages, children = [], []
+  for element in root.iter():
+    if element.tag.endswith("loc") and element.text:
+      parent = children if root.tag.endswith("sitemapindex") else pages
+      parent.append(element.text.strip())
+  return pages, children
+
+
+def discover_sitemap(url, max_pages=MAX_PAGES):
+  """
+  Returns the page URLs listed in a sitemap, following one level of sitemap index.
+  """
+  pages, children = parse_sitemap(fetch_url(url))
+  for child in children:
+    if len(pages) >= max_pages:
+      break
+    pages.extend(parse_sitemap(fetch_url(child))[0])
+  return pages[:max_pages]
+
+
+def discover_links(index_url, path_prefix=None, max_pages=MAX_PAGES):
+  """
+  Lists the same-domain pages linked from an index page, in page order.
+  Args:
+      index_url: The index page, e.g. the table of contents of a blog series.
+      path_prefix: Only keep links whose path starts with this. Defaults to the
+          directory of the index page.
+      max_pages: Maximum number of links returned.
+  Returns:
+      list: Absolute URLs without fragments, the index page first.
+  """
+  index = urlparse(index_url)
+  if path_prefix is None:
+    path_prefix = index.path.rsplit("/", 1)[0] + "/"
+  links = BeautifulSoup(fetch_url(index_url), HTML_PARSER, parse_only=SoupStrainer("a", href=True))
+
+  urls = [urldefrag(index_url)[0]]
+  for link in links.find_all("a", href=True):
+    url = urldefrag(urljoin(index_url, link["href"]))[0]
+    parsed = urlparse(url)
+    if parsed.scheme in ("http", "https") and parsed.netloc == index.netloc and parsed.path.startswith(path_prefix) and url not in urls:
+      urls.append(url)
+  return urls[:max_pages]
+
+
+async def fetch_pages(urls, per_host=PER_HOST_LIMIT):
+  """
+  Fetches and extracts many pages concurrently, with at most per_host requests in
+  flight per host. Fetches go through the shared pooled, cached session.
+  Args:
+      urls: Page URLs.
+      per_host: Maximum concurrent requests to one host.
+  Returns:
+      list: Extracted text of each page in the order of urls, None for pages that failed.
+  """
+  hosts = defaultdict(lambda: asyncio.Semaphore(per_host))
+  loop = asyncio.get_running_loop()
+  workers = max(1, min(len(urls), per_host * len({urlparse(url).netloc for url in urls})))
+
+  with ThreadPoolExecutor(max_workers=workers) as executor:
+    async def fetch(url):
+      async with hosts[urlparse(url).netloc]:
+        try:
+          # Parsing also runs off the event loop so it overlaps with the other downloads
+          return await loop.run_in_executor(executor, lambda: extract_html_text(fetch_url(url)))
+        except Exception as e:
+          print(f"Skipping {url}: {e}")
+          return None
+
+    return await asyncio.gather(*(fetch(url) for url in urls))
+
+
+def merge_pages(pages):
+  """
+  Joins extracted pages into one document, dropping paragraphs already seen on an
+  earlier page, such as repeated series introductions or author boxes.
+  """
+  seen = set()
+  merged = []
+  for page in pages:
+    paragraphs = []
+    for paragraph in (page or "").split("\n\n"):
+      key = " ".join(paragraph.lower().split())
+      if key and key not in seen:
+        seen.add(key)
+        paragraphs.append(paragraph)
+    if paragraphs:
+      merged.append("\n\n".join(paragraphs))
+  return PAGE_BREAK.join(merged)
+
+
+def process_site(source, max_pages=MAX_PAGES, per_host=PER_HOST_LIMIT):
+  """
+  Ingests a multi-page source into one ordered document for get_mini_course.
+  Args:
+      source: A list of URLs, a sitemap URL, or an index page URL whose same-section links are followed.
+      max_pages: Maximum number of pages fetched.
+      per_host: Maximum concurrent requests to one host.
+  Returns:
+      str: The pages' headings and paragraphs in order, pages separated by PAGE_BREAK.
+  """
+  try:
+    if isinstance(source, str):
+      if urlparse(source).path.endswith(".xml"):
+        urls = discover_sitemap(source, max_pages)
+      else:
+        urls = discover_links(source, max_pages=max_pages)
+    else:
+      urls = list(dict.fromkeys(source))[:max_pages]
+
+    text = merge_pages(asyncio.run(fetch_pages(urls, per_host)))
+    if not text.strip():
+      raise ValueError("No readable content found at the provided URLs")
+    return text
+  except Exception as e:
+    raise RuntimeError(f"Error processing URLs: {str(e)}")
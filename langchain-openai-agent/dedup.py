@@ -0,0 +1,150 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+from collections import defaultdict
+
+INDEX_PATH = os.getenv("MINI_COURSE_INDEX_PATH", os.path.join(".cache", "documents.sqlite"))
+SIMILARITY_THRESHOLD = float(os.getenv("MINI_COURSE_SIMILARITY_THRESHOLD", "0.8"))
+
+# 128 MinHash values split into 16 LSH bands of 8 rows: documents with a Jaccard
+# similarity of ~0.7 or more share at least one band with high probability
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 5
+EMPTY_BIN = 0xFFFFFFFF
+
+
+def shingles(text, size=SHINGLE_WORDS):
+  """
+  Returns the set of overlapping word n-grams of a normalized text.
+  """
+  words = re.findall(r"\w+", text.lower())
+  if len(words) < size:
+    return {" ".join(words)} if words else set()
+  return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(text):
+  """
+  Computes a MinHash signature with one-permutation hashing: each shingle is hashed
+  once and its hash goes to one of NUM_PERM bins, keeping the minimum per bin.
+  Empty bins are filled from the next non-empty bin so signatures stay comparable.
+  Args:
+      text: The document text.
+  Returns:
+      array: NUM_PERM unsigned 32-bit values.
+  """
+  signature = array("I", [EMPTY_BIN]) * NUM_PERM
+  for shingle in shingles(text):
+    h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+    bin_index, value = h % NUM_PERM, h >> 32
+    if value < signature[bin_index]:
+      signature[bin_index] = value
+
+  filled = [i for i, value in enumerate(signature) if value != EMPTY_BIN]
+  if filled and len(filled) < NUM_PERM:
+    for i in range(NUM_PERM):
+      if signature[i] == EMPTY_BIN:
+        # Rotate to the next non-empty bin, offsetting by distance to avoid identical fills
+        source = next((j for j in filled if j > i), filled[0])
+        signature[i] = (signature[source] + (source - i) % NUM_PERM) & 0xFFFFFFFF
+  return signature
+
+
+def similarity(a, b):
+  """
+  Estimates the Jaccard similarity of two documents from their signatures.
+  """
+  return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+def _band_keys(signature):
+  return [hash(tuple(signature[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+
+
+class DocumentIndex:
+  """
+  Locality-sensitive hashing index of processed documents and their mini-courses.
+  Signatures are persisted in SQLite and the LSH band tables are kept in memory,
+  so a lookup is a handful of dict lookups however many documents are indexed.
+  """
+
+  def __init__(self, path=INDEX_PATH):
+    self._lock = threading.Lock()
+    self._signatures = {}
+    self._bands = [defaultdict(list) for _ in range(BANDS)]
+
+    directory = os.path.dirname(path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    self._conn = sqlite3.connect(path, check_same_thread=False)
+    self._conn.execute(
+      "CREATE TABLE IF NOT EXISTS documents ("
+      "id INTEGER PRIMARY KEY, source TEXT, signature BLOB NOT NULL, text BLOB NOT NULL, "
+      "mini_course TEXT NOT NULL, created REAL NOT NULL, doc_key TEXT)"
+    )
+    # Indexes created before documents recorded their doc_key
+    if "doc_key" not in {row[1] for row in self._conn.execute("PRAGMA table_info(documents)")}:
+      self._conn.execute("ALTER TABLE documents ADD COLUMN doc_key TEXT")
+    self._conn.commit()
+    for doc_id, blob in self._conn.execute("SELECT id, signature FROM documents"):
+      self._insert(doc_id, array("I", blob))
+
+  def _insert(self, doc_id, signature):
+    self._signatures[doc_id] = signature
+    for band, key in enumerate(_band_keys(signature)):
+      self._bands[band][key].append(doc_id)
+
+  def __len__(self):
+    return len(self._signatures)
+
+  def add(self, text, mini_course, source=None, signature=None, doc_key=None):
+    """
+    Indexes a processed document with the mini-course generated from it, and the
+    doc_key its run is stored under, if any.
+    Returns:
+        int: The id of the new document.
+    """
+    signature = signature or minhash(text)
+    with self._lock:
+      cursor = self._conn.execute(
+        "INSERT INTO documents (source, signature, text, mini_course, created, doc_key) VALUES (?, ?, ?, ?, ?, ?)",
+        (source, signature.tobytes(), zlib.compress(text.encode("utf-8")), mini_course, time.time(), doc_key),
+      )
+      self._conn.commit()
+      self._insert(cursor.lastrowid, signature)
+      return cursor.lastrowid
+
+  def query(self, signature, threshold=SIMILARITY_THRESHOLD):
+    """
+    Finds the most similar indexed document at or above threshold.
+    Args:
+        signature: MinHash signature of the new document.
+        threshold: Minimum estimated Jaccard similarity.
+    Returns:
+        tuple: (document id, similarity), or None if nothing is similar enough.
+    """
+    with self._lock:
+      candidates = {doc_id for band, key in enumerate(_band_keys(signature)) for doc_id in self._bands[band].get(key, ())}
+      scored = [(doc_id, similarity(signature, self._signatures[doc_id])) for doc_id in candidates]
+    scored = [match for match in scored if match[1] >= threshold]
+    return max(scored, key=lambda match: match[1]) if scored else None
+
+  def get(self, doc_id):
+    """
+    Returns:
+        dict: The stored source, text, mini-course and doc_key of a document.
+    """
+    with self._lock:
+      source, text, mini_course, doc_key = self._conn.execute(
+        "SELECT source, text, mini_course, doc_key FROM documents WHERE id = ?", (doc_id,)
+      ).fetchone()
+    return {
+      "id": doc_id, "source": source, "text": zlib.decompress(text).decode("utf-8"), "mini_course": mini_course, "doc_key": doc_key,
+    }
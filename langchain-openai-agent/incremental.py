@@ -0,0 +1,124 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+STAGES_PATH = os.getenv("MINI_COURSE_STAGES_PATH", os.path.join(".cache", "stages.sqlite"))
+STAGES_MAX_BYTES = int(float(os.getenv("MINI_COURSE_STAGES_MAX_MB", "128")) * 1024 * 1024)
+# Chunks and document runs unused for this long are dropped, 0 keeps them forever
+STAGES_MAX_AGE_DAYS = float(os.getenv("MINI_COURSE_STAGES_MAX_AGE_DAYS", "90"))
+
+# Re-uploads whose share of changed chunks is at most this are updated from the previous
+# mini-course, larger structural changes regenerate it from scratch
+MAX_CHANGED_RATIO = float(os.getenv("MINI_COURSE_MAX_CHANGED_RATIO", "0.3"))
+
+
+class StageStore:
+  """
+  Stores the clean/validate output of every chunk by fingerprint, and for each
+  document the fingerprints, merged content and mini-course of its last run.
+  Entries unused for max_age_days are dropped, then the least recently used ones
+  once the store grows over max_bytes.
+  """
+
+  def __init__(self, path=STAGES_PATH, max_bytes=STAGES_MAX_BYTES, max_age_days=STAGES_MAX_AGE_DAYS):
+    self.max_bytes = max_bytes
+    self.max_age = max_age_days * 24 * 3600
+    self._lock = threading.Lock()
+    directory = os.path.dirname(path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    self._conn = sqlite3.connect(path, check_same_thread=False)
+    self._conn.execute(
+      "CREATE TABLE IF NOT EXISTS chunks ("
+      "fingerprint TEXT PRIMARY KEY, cleaned TEXT NOT NULL, valid INTEGER NOT NULL, last_used REAL NOT NULL, "
+      "size INTEGER NOT NULL DEFAULT 0)"
+    )
+    self._conn.execute(
+      "CREATE TABLE IF NOT EXISTS documents ("
+      "doc_key TEXT PRIMARY KEY, fingerprints TEXT NOT NULL, content TEXT NOT NULL, mini_course TEXT NOT NULL, updated REAL NOT NULL, "
+      "size INTEGER NOT NULL DEFAULT 0)"
+    )
+    # Stores created before entries recorded their size
+    for table, columns in (("chunks", "cleaned"), ("documents", "fingerprints || content || mini_course")):
+      if "size" not in {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}:
+        self._conn.execute(f"ALTER TABLE {table} ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute(f"UPDATE {table} SET size = length(CAST({columns} AS BLOB))")
+    self._conn.commit()
+
+  def get_chunk(self, fingerprint):
+    """
+    Returns:
+        tuple: (cleaned text, valid) of a processed chunk, or None.
+    """
+    with self._lock:
+      row = self._conn.execute("SELECT cleaned, valid FROM chunks WHERE fingerprint = ?", (fingerprint,)).fetchone()
+      if row is None:
+        return None
+      self._conn.execute("UPDATE chunks SET last_used = ? WHERE fingerprint = ?", (time.time(), fingerprint))
+      self._conn.commit()
+      return row[0], bool(row[1])
+
+  def put_chunk(self, fingerprint, cleaned, valid):
+    with self._lock:
+      self._conn.execute(
+        "INSERT OR REPLACE INTO chunks (fingerprint, cleaned, valid, last_used, size) VALUES (?, ?, ?, ?, ?)",
+        (fingerprint, cleaned, int(valid), time.time(), len(cleaned.encode("utf-8"))),
+      )
+      self._evict()
+      self._conn.commit()
+
+  def get_document(self, doc_key):
+    """
+    Returns:
+        dict: fingerprints, content and mini_course of the document's last run, or None.
+    """
+    with self._lock:
+      row = self._conn.execute(
+        "SELECT fingerprints, content, mini_course FROM documents WHERE doc_key = ?", (doc_key,)
+      ).fetchone()
+    if row is None:
+      return None
+    return {"fingerprints": json.loads(row[0]), "content": row[1], "mini_course": row[2]}
+
+  def put_document(self, doc_key, fingerprints, content, mini_course):
+    fingerprints = json.dumps(fingerprints)
+    size = len((fingerprints + content + mini_course).encode("utf-8"))
+    with self._lock:
+      self._conn.execute(
+        "INSERT OR REPLACE INTO documents (doc_key, fingerprints, content, mini_course, updated, size) VALUES (?, ?, ?, ?, ?, ?)",
+        (doc_key, fingerprints, content, mini_course, time.time(), size),
+      )
+      self._evict()
+      self._conn.commit()
+
+  def _evict(self):
+    if self.max_age:
+      cutoff = time.time() - self.max_age
+      self._conn.execute("DELETE FROM chunks WHERE last_used < ?", (cutoff,))
+      self._conn.execute("DELETE FROM documents WHERE updated < ?", (cutoff,))
+    total = self._conn.execute(
+      "SELECT (SELECT COALESCE(SUM(size), 0) FROM chunks) + (SELECT COALESCE(SUM(size), 0) FROM documents)"
+    ).fetchone()[0]
+    if total <= self.max_bytes:
+      return
+    entries = self._conn.execute(
+      "SELECT 'chunks', 'fingerprint', fingerprint, size, last_used FROM chunks "
+      "UNION ALL SELECT 'documents', 'doc_key', doc_key, size, updated FROM documents ORDER BY 5"
+    ).fetchall()
+    for table, column, key, size, _ in entries:
+      self._conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (key,))
+      total -= size
+      if total <= self.max_bytes:
+        break
+
+
+def changed_ratio(previous, current):
+  """
+  Share of the current chunk fingerprints that were not in the previous run.
+  """
+  if not current:
+    return 1.0
+  previous = set(previous)
+  return sum(fp not in previous for fp in current) / len(current)
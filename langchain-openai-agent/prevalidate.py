@@ -0,0 +1,139 @@
+import argparse
+import json
+import os
+import re
+from tokens import BOILERPLATE_LINE, MAX_BOILERPLATE_LINE
+
+# Scores at or above VALID_ABOVE skip the LLM as valid, scores below INVALID_BELOW skip it as invalid.
+# Everything in between is sent to the validate LLM call
+VALID_ABOVE = float(os.getenv("MINI_COURSE_PREVALIDATE_VALID_ABOVE", "0.75"))
+INVALID_BELOW = float(os.getenv("MINI_COURSE_PREVALIDATE_INVALID_BELOW", "0.3"))
+
+# Documents shorter than this many words are too thin for a mini-course
+MIN_WORDS = 40
+
+# Common function words per language, used to tell natural-language prose from lists, code and junk
+STOPWORDS = {
+  "en": "the of and to a in is that for it as with on are was be by this an or from at which can not have has its their they these".split(),
+  "es": "de la que el en y los del se las por un para con no una su al es lo como más pero sus le ya o este".split(),
+  "fr": "de la le et les des en un du une est que pour qui dans par sur au pas plus ne se ce avec il sont".split(),
+  "de": "der die und in den von zu das mit sich des auf für ist im dem nicht ein eine als auch es an werden aus".split(),
+  "pt": "de a o que e do da em um para com não uma os no se na por mais as dos como mas ao ele das".split(),
+}
+STOPWORDS = {language: set(words) for language, words in STOPWORDS.items()}
+
+WORD = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+HEADING = re.compile(r"^(?:#{1,6} .+|\d+(?:\.\d+)*\.? +[A-Z].{0,80}|[A-Z][^.!?]{2,80})$")
+
+
+def detect_language(words):
+  """
+  Guesses the language of a word list from its function words.
+  Returns:
+      tuple: (language code, share of words that are its function words)
+  """
+  if not words:
+    return None, 0.0
+  lowered = [word.lower() for word in words]
+  language, hits = max(
+    ((language, sum(word in stopwords for word in lowered)) for language, stopwords in STOPWORDS.items()),
+    key=lambda item: item[1],
+  )
+  return language, hits / len(words)
+
+
+def score_content(text):
+  """
+  Scores how suitable text is for mini-course generation, without calling an LLM.
+  Args:
+      text: The cleaned content.
+  Returns:
+      dict: score (0-1), verdict ("valid", "invalid" or "uncertain"), features and reasons.
+  """
+  lines = [line.strip() for line in text.splitlines() if line.strip()]
+  words = WORD.findall(text)
+  sentences = [sentence for sentence in SENTENCE_END.split(" ".join(lines)) if sentence.strip()]
+  prose_words = sum(len(WORD.findall(sentence)) for sentence in sentences if len(WORD.findall(sentence)) >= 6)
+  language, stopword_ratio = detect_language(words)
+
+  features = {
+    "words": len(words),
+    "prose_ratio": prose_words / len(words) if words else 0.0,
+    "heading_density": sum(bool(HEADING.match(line)) for line in lines) / len(lines) if lines else 0.0,
+    "language": language,
+    "stopword_ratio": stopword_ratio,
+    "boilerplate_ratio": (
+      sum(len(line) <= MAX_BOILERPLATE_LINE and bool(BOILERPLATE_LINE.match(line)) for line in lines) / len(lines)
+      if lines else 1.0
+    ),
+  }
+
+  reasons = []
+  length_score = min(1.0, len(words) / 300)
+  if len(words) < MIN_WORDS:
+    reasons.append(f"Only {len(words)} words, too little material for a mini-course.")
+  if features["prose_ratio"] < 0.5:
+    reasons.append("Most of the text is not written in full sentences.")
+  if stopword_ratio < 0.15:
+    reasons.append("The text does not read as natural-language prose.")
+  if features["boilerplate_ratio"] > 0.3:
+    reasons.append("A large share of the lines are navigation, footer or promotional boilerplate.")
+  # Some headings help, a document made only of headings does not
+  structure_score = 1.0 if 0.01 <= features["heading_density"] <= 0.4 else 0.5
+
+  score = (
+    0.25 * length_score
+    + 0.3 * features["prose_ratio"]
+    + 0.25 * min(1.0, stopword_ratio / 0.3)
+    + 0.1 * structure_score
+    + 0.1 * (1.0 - features["boilerplate_ratio"])
+  )
+  if len(words) < MIN_WORDS:
+    score = min(score, INVALID_BELOW - 0.01)
+
+  if score >= VALID_ABOVE:
+    verdict = "valid"
+  elif score < INVALID_BELOW:
+    verdict = "invalid"
+  else:
+    verdict = "uncertain"
+  return {"score": round(score, 3), "verdict": verdict, "features": features, "reasons": reasons}
+
+
+def evaluate(samples_path, use_llm=False):
+  """
+  Measures agreement of the pre-validator with labeled samples and the LLM calls it saves.
+  Args:
+      samples_path: JSONL file of {"text": ..., "label": "valid" | "invalid"} records.
+      use_llm: Also run validate_content_tool on uncertain samples, as the pipeline would.
+  """
+  with open(samples_path, "r", encoding="utf-8") as f:
+    samples = [json.loads(line) for line in f if line.strip()]
+
+  decided = agreed = final_agreed = 0
+  for sample in samples:
+    result = score_content(sample["text"])
+    verdict = result["verdict"]
+    if verdict != "uncertain":
+      decided += 1
+      agreed += verdict == sample["label"]
+    elif use_llm:
+      from agent import validate_content_tool
+      verdict = "valid" if validate_content_tool(sample["text"])["valid"] else "invalid"
+    final_agreed += verdict == sample["label"]
+    print(f"{sample['label']:8} {result['verdict']:10} {result['score']:.3f}  {sample['text'][:60]!r}")
+
+  print(f"\n{len(samples)} samples, {decided} decided locally ({decided / len(samples):.0%} of validate LLM calls saved)")
+  if decided:
+    print(f"Agreement on locally decided samples: {agreed}/{decided} ({agreed / decided:.0%})")
+  if use_llm:
+    print(f"End-to-end agreement with the LLM for uncertain samples: {final_agreed}/{len(samples)}")
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Measure the local pre-validator against labeled samples.")
+  parser.add_argument("samples", nargs="?", default=os.path.join(os.path.dirname(__file__), "samples", "validation_samples.jsonl"))
+  parser.add_argument("--llm", action="store_true", help="Send uncertain samples to the validate LLM call")
+  args = parser.parse_args()
+  evaluate(args.samples, use_llm=args.llm)
@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+import httpx
+from langchain_openai import ChatOpenAI
+
+# Process-wide registry of LLM clients, compiled chains and other shared objects.
+# Streamlit reruns app.py on every interaction but keeps imported modules alive,
+# so anything stored here is built once per process and shared across sessions.
+
+_lock = threading.RLock()
+_http_client = None
+_llms = {}
+_chains = {}
+_shared = {}
+
+# Seconds spent building each object, and how often it was served from the registry instead
+build_seconds = {}
+reuse_counts = {}
+
+
+def _timed_build(name, factory):
+  start = time.perf_counter()
+  value = factory()
+  build_seconds[name] = time.perf_counter() - start
+  reuse_counts[name] = 0
+  return value
+
+
+def get_http_client():
+  """
+  Returns the keep-alive HTTP connection pool shared by every OpenAI client.
+  """
+  global _http_client
+  with _lock:
+    if _http_client is None:
+      _http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60),
+        timeout=httpx.Timeout(600, connect=10),
+      )
+    return _http_client
+
+
+def get_llm(model="gpt-4o", temperature=0.3):
+  """
+  Returns the shared ChatOpenAI client for a model and temperature.
+  Args:
+      model: The OpenAI model name.
+      temperature: The sampling temperature.
+  Returns:
+      ChatOpenAI: A client reusing the shared HTTP connection pool.
+  """
+  key = (model, float(temperature))
+  with _lock:
+    if key not in _llms:
+      _llms[key] = _timed_build(
+        f"llm:{model}@{key[1]}",
+        lambda: ChatOpenAI(
+          model=model,
+          temperature=key[1],
+          api_key=os.getenv("OPENAI_API_KEY"),
+          http_client=get_http_client(),
+        ),
+      )
+    else:
+      reuse_counts[f"llm:{model}@{key[1]}"] += 1
+    return _llms[key]
+
+
+def get_chain(stage, prompt_template, llm):
+  """
+  Returns the compiled prompt | llm chain for a stage, model and temperature.
+  """
+  key = (stage, llm.model_name, float(llm.temperature))
+  with _lock:
+    if key not in _chains:
+      _chains[key] = _timed_build(f"chain:{stage}", lambda: prompt_template | llm)
+    else:
+      reuse_counts[f"chain:{stage}"] += 1
+    return _chains[key]
+
+
+def get_shared(name, factory):
+  """
+  Returns the object registered under name, building it with factory on first use.
+  """
+  with _lock:
+    if name not in _shared:
+      _shared[name] = _timed_build(name, factory)
+    else:
+      reuse_counts[name] += 1
+    return _shared[name]
+
+
+def startup_report():
+  """
+  Summarizes setup time spent once per process and the time saved by reusing it.
+  Returns:
+      str: A human-readable report.
+  """
+  with _lock:
+    lines = []
+    total_built = total_saved = 0.0
+    for name, seconds in build_seconds.items():
+      saved = seconds * reuse_counts[name]
+      total_built += seconds
+      total_saved += saved
+      lines.append(f"{name}: built in {seconds * 1000:.1f} ms, reused {reuse_counts[name]}x, saved {saved * 1000:.1f} ms")
+    lines.append(f"Total: {total_built * 1000:.1f} ms of setup, {total_saved * 1000:.1f} ms saved by reuse")
+    return "\n".join(lines)
@@ -0,0 +1,156 @@
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+# Maximum prompt tokens sent per call for each stage, override with MINI_COURSE_TOKEN_BUDGET_<STAGE>
+DEFAULT_BUDGETS = {"clean": 16000, "validate": 16000, "improve": 16000, "generate": 32000, "update": 32000, "agent": 16000}
+STAGE_BUDGETS = {
+  stage: int(os.getenv(f"MINI_COURSE_TOKEN_BUDGET_{stage.upper()}", budget))
+  for stage, budget in DEFAULT_BUDGETS.items()
+}
+
+# Words that mark navigation, footer or promotional lines, but only in short link-like lines
+# so that prose about e.g. cookies or subscriptions is kept
+BOILERPLATE_WORDS = (
+  r"(?:follow us|subscribe|sign up|log in|cookies?|privacy policy|terms of (?:service|use)"
+  r"|share (?:this|on)|sponsored|advertisement|click here|read more|skip to (?:main )?content)"
+)
+# Calls to action that are boilerplate even in a longer line when they start it
+CALL_TO_ACTION = r"(?:follow us|subscribe to|share (?:this|on)|click here|read more|skip to (?:main )?content)"
+
+# Short lines that are navigation, footer or promotional boilerplate rather than content
+BOILERPLATE_LINE = re.compile(
+  r"^\s*(?:"
+  r"(?:[\w&'.-]+(?: [\w&'.-]+){0,2} ?[|•·] ?){2,}[\w&'.-]+(?: [\w&'.-]+){0,2}"  # Home | About | Contact
+  r"|(?:\S+ ){0,5}(?:©|\(c\) ?\d{4}|copyright ©? ?\d{4}|all rights reserved)(?: \S+){0,6}"  # © 2025 Example Inc.
+  r"|(?:\S+ ){0,2}" + BOILERPLATE_WORDS + r"\b(?: \S+){0,3}"  # Subscribe to our newsletter
+  + r"|" + CALL_TO_ACTION + r"\b(?: \S+){0,12}"
+  r"|(?:page )?\d+(?: of \d+)?"  # page numbers
+  r"|[-=_*~.—]{3,}"  # separator rules
+  r")\s*$",
+  re.IGNORECASE,
+)
+MAX_BOILERPLATE_LINE = 120
+
+# Running headers and footers: short lines repeated at least this many times in a document.
+# Lines that look like code are never dropped as repeats
+MIN_HEADER_REPEATS = 3
+MAX_HEADER_WORDS = 12
+CODE_CHARS = re.compile(r"[{}()\[\];=<>]")
+
+# Per-stage totals of calls and prompt tokens sent in this process
+usage = defaultdict(Counter)
+_usage_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _encoding(model):
+  try:
+    import tiktoken
+  except ImportError:
+    return None
+  try:
+    return tiktoken.encoding_for_model(model)
+  except KeyError:
+    return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text, model="gpt-4o"):
+  """
+  Counts the tokens of text for a model, estimating 4 characters per token
+  when tiktoken is not installed.
+  """
+  encoding = _encoding(model)
+  if encoding is None:
+    return (len(text) + 3) // 4
+  return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens, model="gpt-4o"):
+  """
+  Cuts text down to at most max_tokens tokens, keeping the beginning.
+  """
+  if max_tokens <= 0:
+    return ""
+  encoding = _encoding(model)
+  if encoding is None:
+    return text[:max_tokens * 4]
+  tokens = encoding.encode(text, disallowed_special=())
+  return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+
+def normalize_whitespace(text):
+  """
+  Collapses runs of spaces inside lines, trailing spaces and extra blank lines.
+  Leading indentation is kept, so code samples and nested lists survive.
+  """
+  text = re.sub(r"(?<=\S)[ \t ]+(?=\S)", " ", text)
+  text = re.sub(r"[ \t ]+$", "", text, flags=re.MULTILINE)
+  return re.sub(r"\n{3,}", "\n\n", text).strip("\n")
+
+
+def compress_text(text):
+  """
+  Cheap local compression applied before any LLM call: collapses whitespace,
+  strips navigation/footer boilerplate lines and drops the repeats of running
+  headers and footers, i.e. short prose lines found at least MIN_HEADER_REPEATS times.
+  Args:
+      text: The content to compress.
+  Returns:
+      str: The compressed content.
+  """
+  text_lines = normalize_whitespace(text).split("\n")
+  counts = Counter(line.strip() for line in text_lines)
+  seen = set()
+  lines = []
+  for line in text_lines:
+    stripped = line.strip()
+    if not stripped:
+      if lines and lines[-1]:
+        lines.append("")
+      continue
+    if len(stripped) <= MAX_BOILERPLATE_LINE and BOILERPLATE_LINE.match(stripped):
+      continue
+    if (
+      counts[stripped] >= MIN_HEADER_REPEATS
+      and len(stripped.split()) <= MAX_HEADER_WORDS
+      and not CODE_CHARS.search(stripped)
+    ):
+      if stripped in seen:
+        continue
+      seen.add(stripped)
+    lines.append(line)
+  return "\n".join(lines).strip("\n")
+
+
+def fit_to_budget(stage, prompt_template, inputs, model="gpt-4o"):
+  """
+  Makes a prompt fit the stage's token budget. Prompts within budget are sent
+  as they are, over-budget content is first compressed locally and only
+  truncated if it is still too long.
+  Args:
+      stage: The pipeline stage, a key of STAGE_BUDGETS.
+      prompt_template: The PromptTemplate the inputs are formatted into.
+      inputs: Dict of prompt inputs, the "content" input is the one reduced.
+      model: Model whose tokenizer is used for counting.
+  Returns:
+      tuple: (inputs, prompt token count)
+  """
+  budget = STAGE_BUDGETS.get(stage)
+  inputs = dict(inputs)
+  tokens = count_tokens(prompt_template.format(**inputs), model)
+
+  if budget and tokens > budget:
+    inputs["content"] = compress_text(inputs["content"])
+    tokens = count_tokens(prompt_template.format(**inputs), model)
+  if budget and tokens > budget:
+    overhead = tokens - count_tokens(inputs["content"], model)
+    inputs["content"] = truncate_to_tokens(inputs["content"], budget - overhead, model)
+    tokens = count_tokens(prompt_template.format(**inputs), model)
+
+  with _usage_lock:
+    usage[stage]["calls"] += 1
+    usage[stage]["prompt_tokens"] += tokens
+  return inputs, tokens
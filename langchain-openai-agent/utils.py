@@ -1,31 +1,238 @@
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, SoupStrainer
 from PyPDF2 import PdfReader
+from chunking import PAGE_BREAK
 
-def process_file(uploaded_file):
+# Maximum number of PDF pages extracted from one upload
+MAX_PDF_PAGES = int(os.getenv("MINI_COURSE_MAX_PDF_PAGES", "1000"))
+
+# Tags extracted from web pages, in document order
+CONTENT_TAGS = ["h1", "h2", "h3", "p"]
+
+# lxml is much faster than the pure-Python parser, fall back to it when lxml is missing
+HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
+# Download limits for process_url
+MAX_DOWNLOAD_BYTES = int(float(os.getenv("MINI_COURSE_MAX_DOWNLOAD_MB", "10")) * 1024 * 1024)
+REQUEST_TIMEOUT = (5, 30)  # connect, read seconds
+HTTP_CACHE_DIR = os.getenv("MINI_COURSE_HTTP_CACHE_DIR", os.path.join(".cache", "http"))
+
+# PDFs with at least this many pages are extracted on a process pool
+PARALLEL_MIN_PAGES = 64
+
+# Pages extracted per process pool task
+PAGES_PER_TASK = 16
+
+
+# PDF reader of each extraction worker process, parsed once when the worker starts
+_worker_reader = None
+
+
+def _init_pdf_worker(data):
+  global _worker_reader
+  _worker_reader = PdfReader(io.BytesIO(data))
+
+
+def _extract_page_batch(start, stop):
   """
-  Processes an uploaded file (PDF or TXT) and extracts its content.
+  Extracts text from pages [start, stop) of the worker's PDF.
+  """
+  return [_worker_reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def iter_pdf_pages(pdf_file, page_range=None, max_pages=MAX_PDF_PAGES, workers=None):
+  """
+  Extracts text from a PDF one page at a time, in page order.
+  Large PDFs are extracted on a process pool with a bounded number of batches
+  in flight, so memory stays flat however many pages the document has.
+  Args:
+      pdf_file: A file-like object or path of the PDF.
+      page_range: Optional (first, last) 1-based inclusive page numbers to extract.
+      max_pages: Maximum number of pages to extract.
+      workers: Number of worker processes. Defaults to the CPU count, 1 disables the pool.
+  Returns:
+      generator: The text of each selected page.
+  """
+  if hasattr(pdf_file, "read"):
+    data = pdf_file.read()
+  else:
+    with open(pdf_file, "rb") as f:
+      data = f.read()
+  reader = PdfReader(io.BytesIO(data))
+
+  first, last = page_range or (1, len(reader.pages))
+  start = max(first, 1) - 1
+  stop = min(last, len(reader.pages), start + max_pages)
+
+  workers = workers or os.cpu_count() or 1
+  if workers == 1 or stop - start < PARALLEL_MIN_PAGES:
+    for i in range(start, stop):
+      yield reader.pages[i].extract_text() or ""
+    return
+
+  with ProcessPoolExecutor(max_workers=workers, initializer=_init_pdf_worker, initargs=(data,)) as executor:
+    batches = iter(range(start, stop, PAGES_PER_TASK))
+    in_flight = deque()
+    for batch_start in batches:
+      in_flight.append(executor.submit(_extract_page_batch, batch_start, min(batch_start + PAGES_PER_TASK, stop)))
+      if len(in_flight) >= 2 * workers:
+        break
+    while in_flight:
+      yield from in_flight.popleft().result()
+      batch_start = next(batches, None)
+      if batch_start is not None:
+        in_flight.append(executor.submit(_extract_page_batch, batch_start, min(batch_start + PAGES_PER_TASK, stop)))
+
+
+def process_file_pages(uploaded_file, page_range=None, max_pages=MAX_PDF_PAGES, workers=None):
+  """
+  Processes an uploaded file (PDF or TXT) and yields its content page by page.
+  A TXT file is yielded as a single page.
   Args:
       uploaded_file: The uploaded file object from Streamlit.
+      page_range: Optional (first, last) 1-based inclusive PDF pages to extract.
+      max_pages: Maximum number of PDF pages to extract.
+      workers: Number of processes used to extract large PDFs.
   Returns:
-      str: Extracted text content from the file.
+      generator: Extracted text of each page.
   """
   try:
     if uploaded_file.type == "application/pdf":
-      pdf_reader = PdfReader(uploaded_file)
-      text = ""
-      for page in pdf_reader.pages:
-        text += page.extract_text()
+      yield from iter_pdf_pages(uploaded_file, page_range=page_range, max_pages=max_pages, workers=workers)
     elif uploaded_file.type == "text/plain":
-      text = uploaded_file.read().decode("utf-8")
+      yield uploaded_file.read().decode("utf-8")
     else:
       raise ValueError("This file is not supported. Upload a PDF or TXT file.")
-    
-    return text 
   except Exception as e:
     raise RuntimeError(f"Error processing file: {str(e)}")
+
+
+def process_file(uploaded_file, page_range=None, max_pages=MAX_PDF_PAGES, workers=None):
+  """
+  Processes an uploaded file (PDF or TXT) and extracts its content.
+  Args:
+      uploaded_file: The uploaded file object from Streamlit.
+      page_range: Optional (first, last) 1-based inclusive PDF pages to extract.
+      max_pages: Maximum number of PDF pages to extract.
+      workers: Number of processes used to extract large PDFs.
+  Returns:
+      str: Extracted text content from the file, with pages separated by PAGE_BREAK.
+  """
+  # Pages are joined once, keeping page boundaries for the chunked pipeline
+  return PAGE_BREAK.join(process_file_pages(uploaded_file, page_range=page_range, max_pages=max_pages, workers=workers))
   
 
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+  """
+  Returns the pooled HTTP session shared by every URL fetch in this process.
+  """
+  global _session
+  with _session_lock:
+    if _session is None:
+      _session = requests.Session()
+      retries = Retry(total=2, backoff_factor=0.5, status_forcelist=[502, 503, 504], allowed_methods=["GET"])
+      adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retries)
+      _session.mount("http://", adapter)
+      _session.mount("https://", adapter)
+      _session.headers["User-Agent"] = "Mozilla/5.0 (compatible; MiniCourseGenerator/1.0)"
+    return _session
+
+
+def _http_cache_path(url):
+  return os.path.join(HTTP_CACHE_DIR, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+
+def _read_http_cache(url):
+  try:
+    with open(_http_cache_path(url), "r", encoding="utf-8") as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return None
+
+
+def _write_http_cache(url, response, text):
+  etag = response.headers.get("ETag")
+  last_modified = response.headers.get("Last-Modified")
+  if not etag and not last_modified:
+    return
+  os.makedirs(HTTP_CACHE_DIR, exist_ok=True)
+  with open(_http_cache_path(url), "w", encoding="utf-8") as f:
+    json.dump({"url": url, "etag": etag, "last_modified": last_modified, "text": text}, f)
+
+
+def fetch_url(url, max_bytes=MAX_DOWNLOAD_BYTES, timeout=REQUEST_TIMEOUT, use_cache=True):
+  """
+  Downloads a web page with the shared session. Pages served with an ETag or
+  Last-Modified header are cached on disk and revalidated with a conditional GET.
+  Args:
+      url: The URL to fetch.
+      max_bytes: Maximum size of the response body.
+      timeout: (connect, read) timeout in seconds.
+      use_cache: Whether to use the on-disk HTTP cache.
+  Returns:
+      str: The decoded response body.
+  """
+  headers = {}
+  cached = _read_http_cache(url) if use_cache else None
+  if cached:
+    if cached.get("etag"):
+      headers["If-None-Match"] = cached["etag"]
+    if cached.get("last_modified"):
+      headers["If-Modified-Since"] = cached["last_modified"]
+
+  with get_session().get(url, headers=headers, timeout=timeout, stream=True) as response:
+    if response.status_code == 304 and cached:
+      return cached["text"]
+    response.raise_for_status()  # Raise an error for HTTP issues
+
+    if int(response.headers.get("Content-Length") or 0) > max_bytes:
+      raise ValueError(f"Page is larger than the {max_bytes // (1024 * 1024)} MB limit")
+    body = bytearray()
+    for block in response.iter_content(chunk_size=64 * 1024):
+      body.extend(block)
+      if len(body) > max_bytes:
+        raise ValueError(f"Page is larger than the {max_bytes // (1024 * 1024)} MB limit")
+
+    text = body.decode(response.encoding or "utf-8", errors="replace")
+    if use_cache:
+      _write_http_cache(url, response, text)
+    return text
+
+
+def extract_html_text(html, parser=HTML_PARSER):
+  """
+  Extracts headings and paragraphs from a web page.
+  Only the content tags are parsed into a tree, the rest of the DOM is skipped.
+  Args:
+      html: The page HTML.
+      parser: The BeautifulSoup parser to use.
+  Returns:
+      str: Headings and paragraphs separated by blank lines.
+  """
+  page_content = BeautifulSoup(html, parser, parse_only=SoupStrainer(CONTENT_TAGS))
+
+  # Extract headings and paragraphs
+  content = []
+  for tag in page_content.find_all(CONTENT_TAGS):
+    content.append(tag.get_text(strip=True))
+
+  return "\n\n".join(content)
+
+
 def process_url(url):
   """
   Fetches and processes content from a public URL.
@@ -35,17 +242,7 @@ def process_url(url):
       str: Extracted text content from the URL.
   """
   try:
-    response = requests.get(url) 
-    response.raise_for_status()  # Raise an error for HTTP issues 
-
-    page_content = BeautifulSoup(response.text, "html.parser")
-
-    # Extract headings and paragraphs
-    content = []
-    for tag in page_content.find_all(["h1", "h2", "h3", "p"]):
-      content.append(tag.get_text(strip=True))
-
-    text = "\n\n".join(content)
+    text = extract_html_text(fetch_url(url))
 
     if not text.strip():
       raise ValueError("No readable content found at this provided URL")
@@ -55,4 +252,3 @@ def process_url(url):
   except Exception as e:
     raise RuntimeError(f"Error processing URL: {str(e)}") 
 
-
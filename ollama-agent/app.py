@@ -1,14 +1,235 @@
-import ollama 
+import argparse
+import itertools
+import json
 import os 
-from typing import Dict, List, Tuple 
+import queue
+import random
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union 
 import traceback
+from client_pool import ClientPool
+from pregrade import EmbeddingCache, PreGrader
+from question_bank import QuestionBank
+from retrieval import PassageIndex, content_hash, tokenize
+
+# One Ollama server URL, or several separated by commas to spread requests over them
+DEFAULT_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+
+# How long Ollama keeps the model loaded after a request, e.g. "30m", "1h" or -1 for forever
+DEFAULT_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# Requests sent to Ollama at the same time when grading answers or generating per-section
+# questions. Match the server's OLLAMA_NUM_PARALLEL setting
+DEFAULT_GRADING_WORKERS = int(os.getenv("OLLAMA_NUM_PARALLEL", "2"))
+
+# Longest text sent in one question generation prompt. Longer documents are split into
+# windows of this size and questioned section by section
+MAX_PROMPT_CHARS = 6000
+
+# Questions whose word sets overlap more than this are treated as duplicates
+DUPLICATE_QUESTION_OVERLAP = 0.6
+
+# Structured output of batch grading, one entry per answered question
+GRADES_SCHEMA = {
+  "type": "object",
+  "properties": {
+    "grades": {
+      "type": "array",
+      "items": {
+        "type": "object",
+        "properties": {
+          "question": {"type": "integer"},
+          "verdict": {"type": "string", "enum": ["correct", "partially_correct", "incorrect"]},
+          "explanation": {"type": "string"},
+          "partial_credit": {"type": "number", "minimum": 0, "maximum": 1}
+        },
+        "required": ["question", "verdict", "explanation", "partial_credit"]
+      }
+    }
+  },
+  "required": ["grades"]
+}
+
+def questions_schema(num_passages: int) -> Dict:
+  """
+  Structured output of question generation. "passage" is the number of the prompt passage the
+  question is drawn from, "answer" a short reference answer used for pre-grading.
+  """
+  return {
+    "type": "object",
+    "properties": {
+      "questions": {
+        "type": "array",
+        "items": {
+          "type": "object",
+          "properties": {
+            "question": {"type": "string"},
+            "difficulty": {"type": "integer", "minimum": 1, "maximum": 5},
+            "passage": {"type": "integer", "minimum": 1, "maximum": num_passages},
+            "answer": {"type": "string"}
+          },
+          "required": ["question", "difficulty", "passage", "answer"]
+        }
+      }
+    },
+    "required": ["questions"]
+  }
+
+
+class JsonObjectStream:
+  """Parses the objects of the array in a streamed {"key": [{...}, ...]} document as each one completes."""
+
+  def __init__(self):
+    self.buffer = ""
+    self.depth = 0
+    self.in_string = False
+    self.escaped = False
+    self.object_start = None
+
+  def feed(self, text: str) -> List[Dict]:
+    objects = []
+    position = len(self.buffer)
+    self.buffer += text
+    for i in range(position, len(self.buffer)):
+      char = self.buffer[i]
+      if self.in_string:
+        if self.escaped:
+          self.escaped = False
+        elif char == "\\":
+          self.escaped = True
+        elif char == '"':
+          self.in_string = False
+      elif char == '"':
+        self.in_string = True
+      elif char in "{[":
+        if char == "{" and self.depth == 2:
+          self.object_start = i
+        self.depth += 1
+      elif char in "}]":
+        self.depth -= 1
+        if char == "}" and self.depth == 2 and self.object_start is not None:
+          try:
+            objects.append(json.loads(self.buffer[self.object_start:i + 1]))
+          except ValueError:
+            pass
+          self.object_start = None
+    return objects
+
+
+class DaemonExecutor:
+  """
+  A minimal thread pool whose workers are daemon threads. Unlike ThreadPoolExecutor, whose workers
+  are joined at interpreter exit, work still running when the user quits (e.g. a generation in
+  flight) is abandoned, so Ctrl+C exits right away.
+  """
+
+  def __init__(self, max_workers: int):
+    self.tasks = queue.Queue()
+    self.workers = max(1, max_workers)
+    for _ in range(self.workers):
+      threading.Thread(target=self._work, daemon=True).start()
+
+  def submit(self, func: Callable, *args, **kwargs) -> Future:
+    future = Future()
+    self.tasks.put((future, func, args, kwargs))
+    return future
+
+  def _work(self):
+    while True:
+      task = self.tasks.get()
+      if task is None:
+        return
+      future, func, args, kwargs = task
+      if not future.set_running_or_notify_cancel():
+        continue
+      try:
+        future.set_result(func(*args, **kwargs))
+      except BaseException as e:
+        future.set_exception(e)
+
+  def shutdown(self):
+    """Cancels queued work and lets the workers exit once their current task, if any, is done."""
+    while True:
+      try:
+        task = self.tasks.get_nowait()
+      except queue.Empty:
+        break
+      if task is not None:
+        task[0].cancel()
+    for _ in range(self.workers):
+      self.tasks.put(None)
+
+
+VERDICT = re.compile(r"\[(CORRECT|INCORRECT|PARTIALLY CORRECT)\]", re.IGNORECASE)
+
+# With sampling on, this many times the quiz length is generated once and banked,
+# and every quiz draws a fresh subset from that pool
+SAMPLE_POOL_FACTOR = 3
 
 
 class QuestionnareAgent:
-  def __init__(self, model_name: str = "llama3.1:8b"):
+  def __init__(self, model_name: str = "llama3.1:8b", host: Union[str, List[str]] = DEFAULT_HOST, keep_alive: str = DEFAULT_KEEP_ALIVE, question_bank: Optional[QuestionBank] = None, pregrade: str = "on"):
     self.model_name = model_name
     self.document_path = "documents"
-    self.client = ollama.Client(host='http://localhost:11434')
+    self.keep_alive = keep_alive
+    # One client per host for every request, so the HTTP connections to Ollama are reused
+    self.client = ClientPool(host)
+    if len(self.client.hosts) > 1:
+      self.client.start_health_checks()
+    # Passage index of each document, by content hash
+    self.indexes: Dict[str, PassageIndex] = {}
+    # Questions already generated for unchanged documents load from here instead of the model
+    self.question_bank = question_bank if question_bank is not None else QuestionBank()
+    # Generation requests, retries, wasted requests and rejected questions, for generation_report
+    self.generation_stats = Counter()
+    self.stats_lock = threading.Lock()
+    # Clear-cut answers are graded from embeddings without an LLM call. In "audit" mode they are
+    # also graded by the LLM to measure agreement
+    self.pregrader = PreGrader(EmbeddingCache(self.client)) if pregrade != "off" else None
+    self.audit_pregrades = pregrade == "audit"
+
+  def get_index(self, text: str) -> PassageIndex:
+    key = content_hash(text)
+    if key not in self.indexes:
+      self.indexes[key] = PassageIndex.for_text(text)
+    return self.indexes[key]
+
+  def client_for(self, text: str):
+    """Client for requests about text. Every request about one document goes to the same host while it is healthy."""
+    return self.client.pinned(content_hash(text))
+
+  def warm_up(self) -> Tuple[float, float]:
+    """
+    Loads the model into memory on every host and keeps it resident, returning the slowest
+    host's cold and warm latency in seconds.
+    """
+    print(f"Loading {self.model_name}... This may take a moment.")
+
+    def warm(host) -> List[float]:
+      latencies = []
+      for _ in range(2):
+        start = time.perf_counter()
+        host.client.generate(
+          model=self.model_name,
+          prompt="Hi",
+          keep_alive=self.keep_alive,
+          options={"num_predict": 1}
+        )
+        latencies.append(time.perf_counter() - start)
+      return latencies
+
+    with ThreadPoolExecutor(max_workers=len(self.client.hosts)) as executor:
+      results = list(executor.map(warm, self.client.hosts))
+
+    cold = max(latencies[0] for latencies in results)
+    warm = max(latencies[1] for latencies in results)
+    hosts = f" on {len(results)} hosts" if len(results) > 1 else ""
+    print(f"Model ready{hosts}. Cold request: {cold:.2f}s, warm request: {warm:.2f}s (kept loaded for {self.keep_alive})")
+    return cold, warm
 
   def read_documents(self) -> Dict[str, str]:
     documents = {}
@@ -18,65 +239,306 @@ class QuestionnareAgent:
           documents[filename] = f.read()
     return documents
   
-  def generate_question(self, text:str) -> List[str]:
-    text_lenth = len(text)
-    num_questions = min(max(3, text_lenth//1000), 7)
+  @staticmethod
+  def question_count(text: str) -> int:
+    """Number of questions asked about a document."""
+    return min(max(3, len(text)//1000), 7)
 
-    max_length = 6000
-    if len(text) > max_length:
-      text = text[:max_length] + '...'
+  def generate_question(self, text:str, verbose: bool = True, section_workers: int = DEFAULT_GRADING_WORKERS, refresh: bool = False, sample: bool = False) -> List[Dict]:
+    """Returns questions about text, each with the passages that support its answer."""
+    return list(self.yield_questions(text, verbose, section_workers, refresh, sample))
 
-    prompt = f"""
-    Based on the following text, generate {num_questions} questions that test understanding of the key concepts. 
-    Format each question on a new line, ending with a question mark. Make questions progressively harder.
+  def stream_questions(self, text: str, verbose: bool = True, section_workers: int = DEFAULT_GRADING_WORKERS, refresh: bool = False, sample: bool = False) -> Iterator[Dict]:
+    """
+    Yields questions about text as soon as each one is parsed from the model's stream.
+    Generation runs on a background thread, so later questions keep generating while the
+    user answers the first ones.
+    """
+    ready = queue.Queue()
+
+    def produce():
+      try:
+        for question in self.yield_questions(text, verbose, section_workers, refresh, sample):
+          ready.put(question)
+      finally:
+        ready.put(None)
 
-    Text: {text}
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+      question = ready.get()
+      if question is None:
+        return
+      yield question
+
+  def yield_questions(self, text: str, verbose: bool = True, section_workers: int = DEFAULT_GRADING_WORKERS, refresh: bool = False, sample: bool = False) -> Iterator[Dict]:
+    """
+    Yields questions about text, each with the passages that support its answer.
+    Questions come from the question bank when this document was already questioned with the
+    same model and options, unless refresh is set. With sample, a larger pool is banked and a
+    fresh subset of it is returned each time.
     """
+    num_questions = self.question_count(text)
+    pool_size = num_questions * SAMPLE_POOL_FACTOR if sample else num_questions
+    options = {"num_questions": pool_size, "max_prompt_chars": MAX_PROMPT_CHARS, "temperature": 0.7, "format": "json-reference"}
+    key = QuestionBank.make_key(text, self.model_name, options)
 
-    try: 
+    questions = None if refresh else self.question_bank.get(key)
+    # Short sets banked before only complete ones were kept are regenerated
+    if questions is not None and len(questions) < pool_size:
+      questions = None
+    if questions is None:
+      questions = []
+      for question in self.create_questions(text, pool_size, verbose, section_workers):
+        questions.append(question)
+        # Without sampling the pool is the quiz, so questions are passed on as they arrive
+        if not sample:
+          yield question
+      # Only a complete set is banked, a short one would be served on every launch until it expires
+      if len(questions) >= pool_size:
+        self.question_bank.put(key, questions)
+      if not sample:
+        return
+    elif verbose:
+      print(f"Loaded {len(questions)} questions from the question bank.")
+
+    if sample and len(questions) > num_questions:
+      # Keep the pool order so the subset still gets progressively harder
+      picked = sorted(random.sample(range(len(questions)), num_questions))
+      questions = [questions[i] for i in picked]
+    yield from questions[:num_questions]
+
+  def create_questions(self, text: str, num_questions: int, verbose: bool = True, section_workers: int = DEFAULT_GRADING_WORKERS) -> Iterator[Dict]:
+    """Generates num_questions questions about text with the model, yielding each one as soon as it is parsed."""
+    index = self.get_index(text)
+
+    # The document's passages grouped into prompt-sized windows
+    windows, size = [[]], 0
+    for passage in index.passages:
+      if windows[-1] and size + len(passage["text"]) > MAX_PROMPT_CHARS:
+        windows.append([])
+        size = 0
+      windows[-1].append(passage)
+      size += len(passage["text"])
+
+    if len(windows) > 1:
+      yield from self.generate_sectioned_questions(windows, index, num_questions, verbose, section_workers)
+      return
+
+    if verbose:
       print("Generating questions... This may take a moment.")
-      client = ollama.Client(host='http://localhost:11434')
-      response = client.chat(
-        model=self.model_name,
-        messages=[
-          {
-            "role": "user",
-            "content": prompt
-          }
-        ],
-        options={
-          "temperature" : 0.7,
-          "num_predict": 1000,
-        }
-      )
+    count = 0
+    for question in self.request_questions(self.client_for(text), windows[0], index, num_questions):
+      count += 1
+      yield question
+    if not count:
+      print("No valid questions generated.")
 
-      questions = []
-      for line in response['message']['content'].split('\n'):
-        line = line.strip()
-        for prefix in ['Q:', 'Question:', '-', '*', '1.', '2.', '3.', '4.', '5.', '6.', '7.']:
-            if line.startswith(prefix):
-                line = line[len(prefix):].strip()
-        if line and '?' in line:
-            questions.append(line)           
-
-      if not questions:
-        print("No valid questions generated. Response was: ", response['message']['content'])
-        return []
-      
-      return questions[:num_questions] 
-      
-    except Exception as e:
-      print(f"Error generating questions: {e}")
-      print("Full error details:")
-      traceback.print_exc()
-      return []
-    
+  def request_questions(self, client, passages: List[Dict], index: PassageIndex, count: int, section: bool = False, temperature: float = 0.7, difficulty: Optional[Tuple[int, int]] = None) -> Iterator[Dict]:
+    """
+    Asks the model for count questions about the numbered passages, constrained to the questions
+    schema, and yields every valid question as soon as its JSON object is complete in the stream.
+    When fewer than count valid questions come back, the missing ones are requested once more.
+    difficulty is the (lowest, highest) difficulty the questions should range over.
+    """
+    questions = []
+    for attempt in range(2):
+      missing = count - len(questions)
+      if missing <= 0:
+        break
+
+      numbered = "\n\n".join(f"[{n}] {passage['text']}" for n, passage in enumerate(passages, 1))
+      asked = "" if not questions else "Do not repeat these questions:\n" + "\n".join(question["question"] for question in questions)
+      if difficulty is None:
+        target = ""
+      elif difficulty[0] == difficulty[1]:
+        target = f"Aim for questions of difficulty {difficulty[0]}."
+      else:
+        target = f"Their difficulty should range from {difficulty[0]} to {difficulty[1]}."
+      prompt = f"""
+      Based on the following {"section of a longer text" if section else "text"}, generate {missing} questions that test understanding of the key concepts.
+      Make questions progressively harder. For each question give its difficulty from 1 (easy) to 5 (hard),
+      the number of the passage it is drawn from, and a short reference answer based on that passage.
+      {target}
+      {asked}
+
+      Text: {numbered}
+      """
+
+      start = time.perf_counter()
+      valid = invalid = 0
+      try:
+        stream = client.chat(
+          model=self.model_name,
+          keep_alive=self.keep_alive,
+          messages=[{"role": "user", "content": prompt}],
+          format=questions_schema(len(passages)),
+          options={
+            # The retry is a little more conservative than the first attempt
+            "temperature": temperature if not attempt else min(temperature, 0.3),
+            "num_predict": 150 * missing + 100,
+          },
+          stream=True
+        )
+        objects = JsonObjectStream()
+        for chunk in stream:
+          for item in objects.feed(chunk['message']['content']):
+            if len(questions) == count:
+              continue
+            question = self.validate_question(item, passages, index, questions)
+            if question is None:
+              invalid += 1
+              continue
+            questions.append(question)
+            valid += 1
+            yield question
+      except Exception as e:
+        print(f"Error generating questions: {e}")
+        print("Full error details:")
+        traceback.print_exc()
+      finally:
+        with self.stats_lock:
+          self.generation_stats["requests"] += 1
+          self.generation_stats["retries"] += attempt
+          self.generation_stats["wasted"] += not valid
+          self.generation_stats["invalid"] += invalid
+          self.generation_stats["questions"] += valid
+          self.generation_stats["seconds"] += time.perf_counter() - start
+
+  @staticmethod
+  def validate_question(item: Dict, passages: List[Dict], index: PassageIndex, accepted: List[Dict]) -> Optional[Dict]:
+    """
+    Checks one generated question object and attaches its source offsets and supporting passages.
+    Returns None for malformed questions and near-duplicates of already accepted ones.
+    """
+    text = item.get("question")
+    difficulty = item.get("difficulty")
+    number = item.get("passage")
+    reference = item.get("answer")
+    if not isinstance(text, str) or "?" not in text or len(tokenize(text)) < 3:
+      return None
+    if not isinstance(difficulty, int) or not 1 <= difficulty <= 5:
+      return None
+    if not isinstance(number, int) or not 1 <= number <= len(passages):
+      return None
+    if not isinstance(reference, str) or not tokenize(reference):
+      return None
+
+    if QuestionnareAgent.is_duplicate(text, accepted):
+      return None
+
+    source = passages[number - 1]
+    supporting = {passage["start"]: passage for passage in index.search(text)}
+    supporting[source["start"]] = source
+    return {
+      "question": text.strip(),
+      "difficulty": difficulty,
+      "reference": reference.strip(),
+      "source": {"start": source["start"], "end": source["end"]},
+      "passages": [supporting[start] for start in sorted(supporting)],
+    }
+
+  @staticmethod
+  def is_duplicate(text: str, accepted: List[Dict]) -> bool:
+    words = set(tokenize(text))
+    for other in accepted:
+      other_words = set(tokenize(other["question"]))
+      if len(words & other_words) / max(1, len(words | other_words)) > DUPLICATE_QUESTION_OVERLAP:
+        return True
+    return False
+
+  def generate_sectioned_questions(self, windows: List[List[Dict]], index: PassageIndex, num_questions: int, verbose: bool = True, workers: int = DEFAULT_GRADING_WORKERS) -> List[Dict]:
+    """
+    Covers a long document by generating candidate questions for each window of its passages
+    concurrently, then picking a de-duplicated, difficulty-ordered set across all windows.
+    With more windows than questions, only evenly spaced windows spanning the whole document
+    are questioned, one question each plus a spare.
+    Quiz positions get evenly spread target difficulties from 1 to 5. Each window is asked for the
+    range of the positions it fills, and picks its candidate closest to each position's target.
+    """
+    if len(windows) > num_questions:
+      # The middle window of each of num_questions equal strides, so the end of the document
+      # is quizzed as much as the beginning
+      windows = [windows[(2 * i + 1) * len(windows) // (2 * num_questions)] for i in range(num_questions)]
+    per_window = max(2, -(-num_questions // len(windows)) + 1)
+    if verbose:
+      print(f"Generating questions for {len(windows)} sections... This may take a moment.")
+
+    def target(position: int) -> int:
+      return 1 + round(4 * position / max(1, num_questions - 1))
+
+    def generate_for_window(w: int, passages: List[Dict]) -> List[Dict]:
+      # Each section is pinned to its own host, so sections of one document spread over the pool
+      client = self.client_for("".join(passage["text"] for passage in passages))
+      # The quiz positions this window fills when questions are taken round-robin
+      positions = range(w, num_questions, len(windows))
+      difficulty = (target(positions[0]), target(positions[-1]))
+      return list(self.request_questions(client, passages, index, per_window, section=True, difficulty=difficulty))
+
+    executor = DaemonExecutor(workers)
+    try:
+      futures = [executor.submit(generate_for_window, w, window) for w, window in enumerate(windows)]
+      candidates = [future.result() for future in futures]
+    finally:
+      executor.shutdown()
+
+    # Take questions round-robin across sections so the whole document is covered. Each pick is
+    # the section's candidate closest to the difficulty of the next quiz position, skipping
+    # near-duplicates of questions already picked
+    picked = []
+    for _ in range(per_window):
+      for window_questions in candidates:
+        if len(picked) == num_questions:
+          break
+        remaining = [question for question in window_questions if not self.is_duplicate(question["question"], picked)]
+        if not remaining:
+          continue
+        wanted = target(len(picked))
+        question = min(remaining, key=lambda question: abs(question["difficulty"] - wanted))
+        window_questions.remove(question)
+        picked.append(question)
+
+    return sorted(picked, key=lambda question: question["difficulty"])
+
+  def generation_report(self, refresh: bool = True) -> Dict[str, float]:
+    """
+    Generates questions for every document in the documents folder without quizzing and prints
+    the wasted-generation rate (requests that produced no valid question) and questions per second.
+    """
+    documents = self.read_documents()
+    with self.stats_lock:
+      self.generation_stats.clear()
+    start = time.perf_counter()
+    for filename, content in documents.items():
+      questions = self.generate_question(content, verbose=False, refresh=refresh)
+      print(f"{filename}: {len(questions)} questions")
+    elapsed = time.perf_counter() - start
 
-  def evaluate_answer(self, text: str, question: str, answer: str) -> str:
+    stats = dict(self.generation_stats)
+    requests = stats.get("requests", 0)
+    report = {
+      "documents": len(documents),
+      "requests": requests,
+      "retries": stats.get("retries", 0),
+      "wasted_rate": stats.get("wasted", 0) / requests if requests else 0.0,
+      "invalid_questions": stats.get("invalid", 0),
+      "questions": stats.get("questions", 0),
+      "questions_per_second": stats.get("questions", 0) / elapsed if elapsed else 0.0,
+    }
+    print(f"\n{report['documents']} documents, {report['requests']} generation requests ({report['retries']} retries)")
+    print(f"Wasted generations: {report['wasted_rate']:.1%}, rejected questions: {report['invalid_questions']}")
+    print(f"{report['questions']} questions in {elapsed:.1f}s ({report['questions_per_second']:.2f} questions/sec)")
+    return report
+
+  def evaluate_answer(self, text: str, question: Dict, answer: str, on_token: Optional[Callable[[str], None]] = None) -> str:
+    """Grades an answer. With on_token, the feedback is streamed and each piece passed to it as it arrives."""
+    # Only the passages supporting the question go into the prompt, not the whole document,
+    # so the prompt size stays roughly constant whatever the document length
+    passages = question.get("passages") or self.get_index(text).search(question["question"])
+    context = "\n\n".join(passage["text"] for passage in passages)
     eval_prompt = f"""
-      Based on this text: {text}
+      Based on these passages from the text: {context}
 
-        Question: {question}
+        Question: {question['question']}
         User's Answer: {answer}
 
         Evaluate if the answer is correct. Respond in this format:
@@ -84,21 +546,199 @@ class QuestionnareAgent:
     """
 
     try: 
-      client = ollama.Client(host='http://localhost:11434')
-      response = client.chat(
+      response = self.client_for(text).chat(
           model=self.model_name,
+          keep_alive=self.keep_alive,
           messages=[{"role": "user", "content": eval_prompt}],
           options={
               "temperature": 0.2,  
               "num_predict": 200
-          }
+          },
+          stream=on_token is not None
       )
-      return response['message']['content']
+      if on_token is None:
+        return response['message']['content']
+
+      feedback = ""
+      for chunk in response:
+        on_token(chunk['message']['content'])
+        feedback += chunk['message']['content']
+      return feedback
     
     except Exception as e:
-      return f"Error evalauting answer: {e}"
+      message = f"Error evalauting answer: {e}"
+      if on_token:
+        on_token(message)
+      return message
     
-  def run_question_agent(self):
+  def pregrade(self, text: str, question: Dict, answer: str) -> Optional[str]:
+    """Immediate feedback for clear-cut answers, None when the answer has to be graded by the LLM."""
+    if self.pregrader is None:
+      return None
+    feedback = self.pregrader.grade(question, answer)
+    if feedback is not None and self.audit_pregrades:
+      llm_feedback = self.evaluate_answer(text, question, answer)
+      self.pregrader.record_audit(self.is_correct(feedback) == self.is_correct(llm_feedback))
+    return feedback
+
+  def grade_answer(self, text: str, question: Dict, answer: str, on_token: Optional[Callable[[str], None]] = None) -> str:
+    """Grades an answer locally when it is clear-cut, and with evaluate_answer otherwise."""
+    feedback = self.pregrade(text, question, answer)
+    if feedback is None:
+      return self.evaluate_answer(text, question, answer, on_token)
+    if on_token:
+      on_token(feedback)
+    return feedback
+
+  def grade_batch(self, text: str, answers: Dict[int, Tuple[Dict, str]]) -> Dict[int, str]:
+    """
+    Pre-grades the answers of a finished quiz and grades the rest with one grade_answers request.
+    When auditing, the pre-graded answers go into that same request to be compared.
+    """
+    pregraded = {}
+    for i, (question, answer) in answers.items():
+      feedback = self.pregrader.grade(question, answer) if self.pregrader else None
+      if feedback is not None:
+        pregraded[i] = feedback
+    if self.audit_pregrades and pregraded:
+      to_grade = answers
+    else:
+      to_grade = {i: answer for i, answer in answers.items() if i not in pregraded}
+    results = self.grade_answers(text, to_grade) if to_grade else {}
+    if self.audit_pregrades:
+      for i, feedback in pregraded.items():
+        self.pregrader.record_audit(self.is_correct(feedback) == self.is_correct(results[i]))
+    results.update(pregraded)
+    return results
+
+  def grade_answers(self, text: str, answers: Dict[int, Tuple[Dict, str]]) -> Dict[int, str]:
+    """
+    Grades all answers of a document in one request, constrained to GRADES_SCHEMA.
+    Answers the model leaves out or returns malformed are graded one by one with evaluate_answer.
+    Returns feedback by question number in the same "[VERDICT] explanation" form as evaluate_answer.
+    """
+    # Every supporting passage once, in document order
+    passages = {}
+    for question, _ in answers.values():
+      for passage in question.get("passages") or self.get_index(text).search(question["question"]):
+        passages[passage["start"]] = passage["text"]
+    context = "\n\n".join(passages[start] for start in sorted(passages))
+    quiz = "\n\n".join(
+      f"Question {i}: {question['question']}\nUser's Answer: {answer}" for i, (question, answer) in sorted(answers.items())
+    )
+    grade_prompt = f"""
+      Based on these passages from the text: {context}
+
+        {quiz}
+
+        Grade every answer. For each question give its number, a verdict (correct, partially_correct
+        or incorrect), a brief explanation including the correct answer if wrong, and partial credit
+        from 0 to 1.
+    """
+
+    results = {}
+    try:
+      response = self.client_for(text).chat(
+          model=self.model_name,
+          keep_alive=self.keep_alive,
+          messages=[{"role": "user", "content": grade_prompt}],
+          format=GRADES_SCHEMA,
+          options={
+              "temperature": 0.2,
+              "num_predict": 200 * len(answers) + 100
+          }
+      )
+      for grade in json.loads(response['message']['content'])["grades"]:
+        i = grade.get("question")
+        if i in answers and i not in results and grade.get("verdict") in ("correct", "partially_correct", "incorrect"):
+          verdict = grade["verdict"].replace("_", " ").upper()
+          credit = f" (credit {float(grade.get('partial_credit', 0)):.1f})" if verdict == "PARTIALLY CORRECT" else ""
+          results[i] = f"[{verdict}]{credit} {grade.get('explanation', '').strip()}"
+    except Exception as e:
+      print(f"Batch grading failed, grading answers one by one: {e}")
+
+    for i, (question, answer) in sorted(answers.items()):
+      if i not in results:
+        results[i] = self.evaluate_answer(text, question, answer)
+    return results
+
+  @staticmethod
+  def is_correct(feedback: str) -> bool:
+    """True when the feedback's verdict is fully correct, wherever the model put the verdict tag."""
+    match = VERDICT.search(feedback)
+    return bool(match) and match.group(1).upper() == "CORRECT"
+
+  def run_quiz(self, content: str, question_list: Iterable[Dict], grading: str = "async", feedback_mode: str = "live", grading_workers: int = DEFAULT_GRADING_WORKERS, total: Optional[int] = None):
+    """
+    Asks every question of a document and grades the answers.
+    question_list can be a stream of questions still being generated, with total the expected count.
+    With async grading, answers are graded on a worker pool while the next question is shown.
+    Feedback is printed as soon as each grade is ready ("live") or all at the end ("end").
+    With sync grading, feedback is streamed token by token.
+    With batch grading, all answers are graded in one request after the last question.
+    """
+    executor = DaemonExecutor(grading_workers) if grading == "async" else None
+    print_lock = threading.Lock()
+    grades = {}
+    answers = {}
+    if total is None:
+      total = len(question_list)
+    asked = 0
+
+    def show_feedback(i, feedback):
+      with print_lock:
+        print(f"\nFeedback for question {i}:", feedback)
+        show_partial_credit_note(feedback)
+
+    def show_partial_credit_note(feedback):
+      if "[PARTIALLY CORRECT]" in feedback.upper():
+        print("Partial credit score doesn't count towards the final score")
+
+    try:
+      for i, question in enumerate(question_list, 1):
+        asked = i
+        with print_lock:
+          print(f"\nQuestion {i}/{max(total, i)}:")
+          print(question["question"])
+
+        user_answer = input("\nYour answer: ").strip()
+        if not user_answer:
+            print("Skipping question...")
+            continue
+
+        if grading == "batch":
+          answers[i] = (question, user_answer)
+        elif executor:
+          grades[i] = executor.submit(self.grade_answer, content, question, user_answer)
+          if feedback_mode == "live":
+            grades[i].add_done_callback(lambda future, i=i: show_feedback(i, future.result()))
+        else:
+          print(f"\nFeedback for question {i}: ", end="", flush=True)
+          grades[i] = self.grade_answer(content, question, user_answer, on_token=lambda token: print(token, end="", flush=True))
+          print()
+          show_partial_credit_note(grades[i])
+
+      if executor and grades:
+        print("\nWaiting for the remaining grades...")
+      results = {i: grade.result() if executor else grade for i, grade in grades.items()}
+      if answers:
+        print("\nGrading your answers...")
+        results.update(self.grade_batch(content, answers))
+    finally:
+      if executor:
+        executor.shutdown()
+
+    if (executor and feedback_mode == "end") or grading == "batch":
+      for i, feedback in sorted(results.items()):
+        show_feedback(i, feedback)
+
+    correct_count = sum(self.is_correct(feedback) for feedback in results.values())
+    score = (correct_count / asked) * 100 if asked else 0.0
+    print(f"\nYou got {correct_count} out of {asked} questions correct ({score:.1f}%)")
+    print("Note: Only fully correct answers are counted in the score.")
+    print("="*50)
+
+  def run_question_agent(self, prefetch: int = 2, grading: str = "async", feedback_mode: str = "live", grading_workers: int = DEFAULT_GRADING_WORKERS, refresh: bool = False, sample: bool = False):
     print("Welcome to the AI Questionnare Agent!")
     print("Reading documents from the documents folder... \n")
 
@@ -106,40 +746,86 @@ class QuestionnareAgent:
     if not documents:
       print("No text document found. Please a text document to the folder.")
       return 
-    
-    for filename, content in documents.items():
-      print(f"\n Processing documents: {filename}")
-      print("="*50)
 
-      question_list = self.generate_question(content)
-      if not question_list:
-        print(f"Could not generate questions for {filename}")
-        continue
+    try:
+      self.warm_up()
+    except Exception as e:
+      print(f"Could not warm up the model: {e}")
 
-      correct_count = 0 
-      for i, question in enumerate(question_list, 1):
-        print(f"\nQuestion {i}/{len(question_list)}:")
-        print(question)
+    # Questions for the next `prefetch` documents are generated in the background while the
+    # current quiz runs. One worker per host, since each Ollama server handles one request at a time.
+    # The workers are daemon threads, so quitting abandons a generation in flight instead of waiting for it
+    filenames = list(documents)
+    executor = DaemonExecutor(len(self.client.hosts)) if prefetch > 0 else None
+    pending = {}
 
-        user_answer = input("\nYour answer: ").strip()
-        if not user_answer:
-            print("Skipping question...")
-            continue
-        
-        feedback = self.evaluate_answer(content, question, user_answer)
-        print("\nFeedback:", feedback)
+    try:
+      for index, filename in enumerate(filenames):
+        content = documents[filename]
+        print(f"\n Processing documents: {filename}")
+        print("="*50)
+
+        if filename in pending:
+          if not pending[filename].done():
+            print("Generating questions... This may take a moment.")
+          question_list = pending.pop(filename).result()
+          total = len(question_list)
+        else:
+          # Nothing prefetched for this document, so its questions are streamed and the
+          # first one is asked while the rest are still generating
+          stream = self.stream_questions(content, refresh=refresh, sample=sample)
+          first = next(stream, None)
+          question_list = [] if first is None else itertools.chain([first], stream)
+          total = self.question_count(content)
 
-        if feedback.strip().upper().startswith("[CORRECT]"):
-          correct_count += 1
-        elif "[PARTIALLY CORRECT]" in feedback.upper():
-          print("Partial credit score doesn't count towards the final score")
+        # Prefetch only once this document's request is under way, so it is served first
+        if executor:
+          for upcoming in filenames[index + 1:index + prefetch + 1]:
+            if upcoming not in pending:
+              pending[upcoming] = executor.submit(self.generate_question, documents[upcoming], False, refresh=refresh, sample=sample)
 
+        if not question_list:
+          print(f"Could not generate questions for {filename}")
+          continue
 
-      score = (correct_count / len(question)) * 100
-      print(f"\nYou got {correct_count} out of {len(question_list)} questions correct ({score:.1f}%)")
-      print("Note: Only fully correct answers are counted in the score.")
-      print("="*50)
+        self.run_quiz(content, question_list, grading, feedback_mode, grading_workers, total)
+    finally:
+      # Drop prefetched work that was not used, e.g. when the user quits with Ctrl+C
+      if executor:
+        executor.shutdown()
+
+    if self.pregrader:
+      report = self.pregrader.report()
+      if report["answers"]:
+        print(f"\nPre-graded {report['pregraded']} of {report['answers']} answers without the LLM (escalation rate {report['escalation_rate']:.1%})")
+      if report["audited"]:
+        print(f"Pre-grades agreed with LLM grading on {report['agreement']:.1%} of {report['audited']} audited answers")
 
 if __name__ == "__main__":
-  agent = QuestionnareAgent()
-  agent.run_question_agent()
+  parser = argparse.ArgumentParser(description="AI Questionnare Agent")
+  parser.add_argument("--model", default="llama3.1:8b", help="Ollama model to use")
+  parser.add_argument("--host", default=DEFAULT_HOST, help="Ollama server URL, or several separated by commas (or set OLLAMA_HOST)")
+  parser.add_argument("--keep-alive", default=DEFAULT_KEEP_ALIVE, help="How long Ollama keeps the model loaded, e.g. 30m or -1")
+  parser.add_argument("--prefetch", type=int, default=2, help="Documents whose questions are generated ahead in the background (0 disables)")
+  parser.add_argument("--grading", choices=["sync", "async", "batch"], default="async", help="Grade each answer before the next question, in the background, or all in one request at the end")
+  parser.add_argument("--feedback", choices=["live", "end"], default="live", help="Print async feedback as it completes or at the end of each document")
+  parser.add_argument("--grading-workers", type=int, default=DEFAULT_GRADING_WORKERS, help="Answers graded concurrently (match OLLAMA_NUM_PARALLEL)")
+  parser.add_argument("--refresh", action="store_true", help="Regenerate questions instead of loading them from the question bank")
+  parser.add_argument("--sample", action="store_true", help=f"Bank {SAMPLE_POOL_FACTOR}x more questions per document and ask a fresh subset each run")
+  parser.add_argument("--pregrade", choices=["on", "off", "audit"], default="on", help="Grade clear-cut answers from embeddings without the LLM; audit also grades them with the LLM and reports agreement")
+  parser.add_argument("--generation-report", action="store_true", help="Generate questions for every document without quizzing and report wasted generations and questions/sec")
+  args = parser.parse_args()
+
+  agent = QuestionnareAgent(model_name=args.model, host=args.host, keep_alive=args.keep_alive, pregrade=args.pregrade)
+  if args.generation_report:
+    agent.generation_report()
+    raise SystemExit
+
+  agent.run_question_agent(
+    prefetch=args.prefetch,
+    grading=args.grading,
+    feedback_mode=args.feedback,
+    grading_workers=args.grading_workers,
+    refresh=args.refresh,
+    sample=args.sample
+  )
@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+from app import DEFAULT_GRADING_WORKERS, DEFAULT_HOST, DEFAULT_KEEP_ALIVE, QuestionnareAgent
+from retrieval import content_hash
+
+
+def iter_documents(root: str, extensions: Tuple[str, ...] = (".txt",)) -> Iterator[str]:
+  """Yields the paths of matching files under root one at a time, in a stable order."""
+  for directory, subdirectories, filenames in os.walk(root):
+    subdirectories.sort()
+    for filename in sorted(filenames):
+      if filename.lower().endswith(extensions):
+        yield os.path.join(directory, filename)
+
+
+class Manifest:
+  """
+  Size, mtime and content hash of every document already written to the output, so later runs
+  skip unchanged files. A changed mtime alone only costs a hash check, not a regeneration.
+  """
+
+  def __init__(self, path: str):
+    self.path = path
+    try:
+      with open(path, "r", encoding="utf-8") as f:
+        self.entries: Dict[str, Dict] = json.load(f)
+    except (OSError, ValueError):
+      self.entries = {}
+
+  def check(self, path: str) -> Tuple[bool, Optional[str]]:
+    """Returns (unchanged, text). The text is only read when the mtime or size differ from the manifest."""
+    stat = os.stat(path)
+    entry = self.entries.get(path)
+    if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+      return True, None
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+      text = f.read()
+    if entry and entry["hash"] == content_hash(text):
+      entry["mtime"] = stat.st_mtime
+      return True, text
+    return False, text
+
+  def record(self, path: str, text: str):
+    stat = os.stat(path)
+    self.entries[path] = {"mtime": stat.st_mtime, "size": stat.st_size, "hash": content_hash(text)}
+
+  def save(self):
+    # Write to a temporary file first so a crash never leaves a truncated manifest behind
+    tmp_path = self.path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+      json.dump(self.entries, f)
+    os.replace(tmp_path, self.path)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+  """Nearest-rank percentile of values."""
+  ordered = sorted(values)
+  return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def generate(agent: QuestionnareAgent, path: str, text: str) -> Tuple[List[Dict], float]:
+  start = time.perf_counter()
+  # Documents already run in parallel, so each one generates its sections one at a time
+  try:
+    questions = agent.generate_question(text, verbose=False, section_workers=1)
+  finally:
+    # The passage index is only needed while the document is generated
+    agent.indexes.pop(content_hash(text), None)
+  return questions, time.perf_counter() - start
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Generate question sets for a folder of documents without quizzing.")
+  parser.add_argument("--input-dir", required=True, help="Folder searched recursively for documents")
+  parser.add_argument("--output", required=True, help="JSONL file results are appended to")
+  parser.add_argument("--manifest", help="Manifest of processed files (default: <output>.manifest.json)")
+  parser.add_argument("--extensions", default=".txt", help="Comma-separated file extensions to include")
+  parser.add_argument("--workers", type=int, help="Documents generated concurrently (default: OLLAMA_NUM_PARALLEL per host)")
+  parser.add_argument("--model", default="llama3.1:8b", help="Ollama model to use")
+  parser.add_argument("--host", default=DEFAULT_HOST, help="Ollama server URL, or several separated by commas (or set OLLAMA_HOST)")
+  parser.add_argument("--keep-alive", default=DEFAULT_KEEP_ALIVE, help="How long Ollama keeps the model loaded, e.g. 30m or -1")
+  args = parser.parse_args()
+
+  extensions = tuple(extension.strip().lower() for extension in args.extensions.split(",") if extension.strip())
+  manifest = Manifest(args.manifest or args.output + ".manifest.json")
+  agent = QuestionnareAgent(model_name=args.model, host=args.host, keep_alive=args.keep_alive)
+  workers = args.workers or DEFAULT_GRADING_WORKERS * len(agent.client.hosts)
+  try:
+    agent.warm_up()
+  except Exception as e:
+    print(f"Could not warm up the model: {e}")
+
+  done = failed = skipped = 0
+  latencies = []
+  start = time.perf_counter()
+  with open(args.output, "a", encoding="utf-8") as output, ThreadPoolExecutor(max_workers=workers) as executor:
+    running = {}
+
+    def collect(futures):
+      nonlocal done, failed
+      for future in futures:
+        path, text = running.pop(future)
+        try:
+          questions, seconds = future.result()
+          if not questions:
+            raise RuntimeError("no valid questions generated")
+        except Exception as e:
+          failed += 1
+          print(f"failed: {path}: {e}")
+          continue
+        output.write(json.dumps({
+          "path": path,
+          "content_hash": content_hash(text),
+          "model": args.model,
+          "seconds": round(seconds, 3),
+          "questions": questions,
+        }) + "\n")
+        output.flush()
+        manifest.record(path, text)
+        latencies.append(seconds)
+        done += 1
+        print(f"[{done}] {path}: {len(questions)} questions in {seconds:.1f}s")
+        if done % 50 == 0:
+          manifest.save()
+
+    try:
+      # Files are read as they are reached and at most two per worker are in flight, so memory
+      # stays flat however large the tree is
+      for path in iter_documents(args.input_dir, extensions):
+        unchanged, text = manifest.check(path)
+        if unchanged:
+          skipped += 1
+          continue
+        if len(running) >= 2 * workers:
+          finished, _ = wait(running, return_when=FIRST_COMPLETED)
+          collect(finished)
+        running[executor.submit(generate, agent, path, text)] = (path, text)
+      collect(list(running))
+    finally:
+      manifest.save()
+
+  elapsed = time.perf_counter() - start
+  print(f"\nGenerated question sets for {done} documents, {failed} failed, {skipped} unchanged and skipped, in {elapsed:.1f}s")
+  if done:
+    print(f"Throughput: {done / elapsed:.2f} docs/sec")
+    print(f"Latency per document: p50 {percentile(latencies, 0.5):.1f}s, p90 {percentile(latencies, 0.9):.1f}s, p99 {percentile(latencies, 0.99):.1f}s")
+  if len(agent.client.hosts) > 1:
+    for host in agent.client.stats():
+      print(f"{host['host']}: {host['served']} requests{' (ejected)' if host['ejected'] else ''}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,182 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Union
+import ollama
+
+# Consecutive failures after which a host is taken out of rotation, and for how long
+FAILURE_THRESHOLD = int(os.getenv("OLLAMA_POOL_FAILURE_THRESHOLD", "2"))
+EJECT_SECONDS = float(os.getenv("OLLAMA_POOL_EJECT_SECONDS", "30"))
+HEALTH_CHECK_SECONDS = float(os.getenv("OLLAMA_POOL_HEALTH_CHECK_SECONDS", "10"))
+
+# A document stays on its preferred host unless that host has this many more requests in
+# flight than the least busy one
+AFFINITY_SLACK = 2
+
+
+class Host:
+  def __init__(self, url: str):
+    self.url = url
+    self.client = ollama.Client(host=url)
+    self.outstanding = 0
+    self.served = 0
+    self.failures = 0
+    self.ejected_until = 0.0
+
+
+class ClientPool:
+  """
+  Spreads chat, generate and embed requests over several Ollama hosts.
+  Requests go to the host with the fewest requests in flight. Requests pinned to a document go
+  to the same host each time, so its prompt cache stays warm. Failing hosts are ejected for a
+  while, and requests that fail before any output are retried on another host.
+  """
+
+  def __init__(self, hosts: Union[str, List[str]], failure_threshold: int = FAILURE_THRESHOLD, eject_seconds: float = EJECT_SECONDS):
+    if isinstance(hosts, str):
+      hosts = [host.strip() for host in hosts.split(",") if host.strip()]
+    if not hosts:
+      raise ValueError("At least one Ollama host is required")
+    self.hosts = [Host(url) for url in dict.fromkeys(hosts)]
+    self.failure_threshold = failure_threshold
+    self.eject_seconds = eject_seconds
+    self._lock = threading.Lock()
+    self._health_thread = None
+
+  def chat(self, **kwargs):
+    return self.request("chat", None, kwargs)
+
+  def generate(self, **kwargs):
+    return self.request("generate", None, kwargs)
+
+  def embed(self, **kwargs):
+    return self.request("embed", None, kwargs)
+
+  def pinned(self, affinity: str) -> "PinnedClient":
+    """A client whose requests all prefer the host that affinity (e.g. a content hash) maps to."""
+    return PinnedClient(self, affinity)
+
+  def request(self, method: str, affinity: Optional[str], kwargs: Dict, tried: Optional[List[Host]] = None):
+    tried = tried or []
+    while True:
+      host = self._acquire(affinity, tried)
+      try:
+        result = getattr(host.client, method)(**kwargs)
+      except Exception as e:
+        self._release(host, e)
+        if not self._retryable(e, tried):
+          raise
+        tried = tried + [host]
+        continue
+      if kwargs.get("stream"):
+        return self._stream(host, result, method, affinity, kwargs, tried)
+      self._release(host, None)
+      return result
+
+  def _stream(self, host: Host, stream: Iterator, method: str, affinity: Optional[str], kwargs: Dict, tried: List[Host]) -> Iterator:
+    # The request stays outstanding on its host until the stream is consumed
+    started = False
+    error = None
+    try:
+      for chunk in stream:
+        started = True
+        yield chunk
+    except Exception as e:
+      error = e
+    finally:
+      self._release(host, error)
+    if error is not None:
+      if started or not self._retryable(error, tried):
+        raise error
+      yield from self.request(method, affinity, kwargs, tried + [host])
+
+  def _retryable(self, error: Exception, tried: List[Host]) -> bool:
+    return self._is_host_failure(error) and len(tried) + 1 < len(self.hosts)
+
+  @staticmethod
+  def _is_host_failure(error: Exception) -> bool:
+    # Client errors such as an invalid request would fail on every host
+    status = getattr(error, "status_code", None)
+    return not (isinstance(error, ollama.ResponseError) and status is not None and 0 <= status < 500)
+
+  def _acquire(self, affinity: Optional[str], exclude: List[Host]) -> Host:
+    now = time.monotonic()
+    with self._lock:
+      candidates = [host for host in self.hosts if host not in exclude]
+      # When every host is ejected, keep trying them rather than failing outright
+      candidates = [host for host in candidates if host.ejected_until <= now] or candidates
+      host = min(candidates, key=lambda host: (host.outstanding, host.served))
+      if affinity is not None:
+        # Rendezvous hashing: a document keeps its host as long as that host stays healthy
+        preferred = max(candidates, key=lambda host: hashlib.sha256(f"{affinity}|{host.url}".encode("utf-8")).digest())
+        if preferred.outstanding <= host.outstanding + AFFINITY_SLACK:
+          host = preferred
+      host.outstanding += 1
+      host.served += 1
+      return host
+
+  def _release(self, host: Host, error: Optional[Exception]):
+    with self._lock:
+      host.outstanding -= 1
+      if error is None:
+        host.failures = 0
+        host.ejected_until = 0.0
+      elif self._is_host_failure(error):
+        host.failures += 1
+        if host.failures >= self.failure_threshold:
+          if host.ejected_until <= time.monotonic():
+            print(f"Ejecting Ollama host {host.url} for {self.eject_seconds:.0f}s: {error}")
+          host.ejected_until = time.monotonic() + self.eject_seconds
+
+  def health_check(self):
+    """Probes every host, ejecting unreachable ones and bringing recovered ones back."""
+    for host in self.hosts:
+      try:
+        host.client.list()
+      except Exception:
+        with self._lock:
+          host.failures = max(host.failures + 1, self.failure_threshold)
+          host.ejected_until = time.monotonic() + self.eject_seconds
+        continue
+      with self._lock:
+        host.failures = 0
+        host.ejected_until = 0.0
+
+  def start_health_checks(self, interval: float = HEALTH_CHECK_SECONDS):
+    """Runs health_check every interval seconds on a background thread."""
+    if self._health_thread is not None:
+      return
+
+    def run():
+      while True:
+        self.health_check()
+        time.sleep(interval)
+
+    self._health_thread = threading.Thread(target=run, daemon=True)
+    self._health_thread.start()
+
+  def stats(self) -> List[Dict]:
+    now = time.monotonic()
+    with self._lock:
+      return [
+        {"host": host.url, "served": host.served, "outstanding": host.outstanding, "ejected": host.ejected_until > now}
+        for host in self.hosts
+      ]
+
+
+class PinnedClient:
+  """The chat, generate and embed methods of a ClientPool with a fixed host affinity."""
+
+  def __init__(self, pool: ClientPool, affinity: str):
+    self.pool = pool
+    self.affinity = affinity
+
+  def chat(self, **kwargs):
+    return self.pool.request("chat", self.affinity, kwargs)
+
+  def generate(self, **kwargs):
+    return self.pool.request("generate", self.affinity, kwargs)
+
+  def embed(self, **kwargs):
+    return self.pool.request("embed", self.affinity, kwargs)
@@ -0,0 +1,147 @@
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional
+from retrieval import CACHE_DIR, tokenize
+
+EMBED_MODEL = os.getenv("QUESTIONNARE_EMBED_MODEL", "nomic-embed-text")
+EMBEDDINGS_PATH = os.getenv("QUESTIONNARE_EMBEDDINGS_PATH", os.path.join(CACHE_DIR, "embeddings.sqlite"))
+
+# Answers at least this similar to the reference answer are correct, answers less similar than
+# this to both the reference and the supporting passages are off-topic. Everything in between
+# goes to the LLM
+CORRECT_ABOVE = float(os.getenv("QUESTIONNARE_PREGRADE_CORRECT_ABOVE", "0.9"))
+OFF_TOPIC_BELOW = float(os.getenv("QUESTIONNARE_PREGRADE_OFF_TOPIC_BELOW", "0.4"))
+
+# Answers that say the user does not know
+NON_ANSWER = re.compile(r"^\s*(?:i don'?t know|idk|no idea|not sure|dunno|pass|skip|\?+|n/?a|none)[\s.!?]*$", re.IGNORECASE)
+
+# Answers whose word sets overlap the question's this much only restate it
+RESTATED_OVERLAP = 0.8
+
+
+class EmbeddingCache:
+  """Ollama embeddings stored in SQLite by model and text hash, so each text is embedded once."""
+
+  def __init__(self, client, model: str = EMBED_MODEL, path: str = EMBEDDINGS_PATH):
+    self.client = client
+    self.model = model
+    self._lock = threading.Lock()
+    directory = os.path.dirname(path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    self._conn = sqlite3.connect(path, check_same_thread=False)
+    self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+    self._conn.commit()
+
+  def key(self, text: str) -> str:
+    return hashlib.sha256(f"{self.model}\n{text}".encode("utf-8")).hexdigest()
+
+  def embed(self, texts: List[str]) -> List[List[float]]:
+    """Returns the embedding of each text, requesting only the uncached ones from Ollama, in one call."""
+    keys = [self.key(text) for text in texts]
+    vectors = {}
+    with self._lock:
+      for key in set(keys):
+        row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+          vectors[key] = array("f", row[0]).tolist()
+
+    missing = list(dict.fromkeys(text for text, key in zip(texts, keys) if key not in vectors))
+    if missing:
+      response = self.client.embed(model=self.model, input=missing)
+      with self._lock:
+        for text, vector in zip(missing, response["embeddings"]):
+          vectors[self.key(text)] = vector
+          self._conn.execute(
+            "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", (self.key(text), array("f", vector).tobytes())
+          )
+        self._conn.commit()
+    return [vectors[key] for key in keys]
+
+
+def cosine(a: List[float], b: List[float]) -> float:
+  dot = sum(x * y for x, y in zip(a, b))
+  norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+  return dot / norm if norm else 0.0
+
+
+class PreGrader:
+  """
+  Grades clear-cut answers locally, by comparing them with the question's reference answer and
+  supporting passages, so only uncertain answers need a full LLM grading.
+  """
+
+  def __init__(self, embeddings: EmbeddingCache, correct_above: float = CORRECT_ABOVE, off_topic_below: float = OFF_TOPIC_BELOW):
+    self.embeddings = embeddings
+    self.correct_above = correct_above
+    self.off_topic_below = off_topic_below
+    # Pre-graded and escalated answers, and how often audited pre-grades agreed with the LLM
+    self.stats = Counter()
+    self.available = True
+    self._lock = threading.Lock()
+
+  def grade(self, question: Dict, answer: str) -> Optional[str]:
+    """
+    Returns feedback in the "[VERDICT] explanation" form of evaluate_answer for clear-cut answers,
+    or None when the answer has to be graded by the LLM.
+    """
+    verdict = self.verdict(question, answer)
+    with self._lock:
+      self.stats["answers"] += 1
+      self.stats["escalated" if verdict is None else "pregraded"] += 1
+    return verdict
+
+  def verdict(self, question: Dict, answer: str) -> Optional[str]:
+    reference = question.get("reference")
+    expected = f" Expected answer: {reference}" if reference else ""
+    words = set(tokenize(answer))
+    if not words or NON_ANSWER.match(answer):
+      return f"[INCORRECT] No answer was given.{expected}"
+    question_words = set(tokenize(question["question"]))
+    if len(words & question_words) / len(words | question_words) >= RESTATED_OVERLAP:
+      return f"[INCORRECT] The answer only restates the question.{expected}"
+
+    # Questions banked before reference answers were captured always go to the LLM
+    if not reference or not self.available:
+      return None
+    passages = [passage["text"] for passage in question.get("passages") or []]
+    try:
+      answer_vector, reference_vector, *passage_vectors = self.embeddings.embed([answer, reference] + passages)
+    except Exception as e:
+      # e.g. the embedding model is not pulled, stop trying for the rest of the run
+      self.available = False
+      print(f"Pre-grading unavailable, grading every answer with the LLM: {e}")
+      return None
+
+    to_reference = cosine(answer_vector, reference_vector)
+    to_passages = max((cosine(answer_vector, vector) for vector in passage_vectors), default=0.0)
+    if to_reference >= self.correct_above:
+      return f"[CORRECT] The answer matches the expected answer: {reference}"
+    if max(to_reference, to_passages) < self.off_topic_below:
+      return f"[INCORRECT] The answer is unrelated to the question.{expected}"
+    return None
+
+  def record_audit(self, agreed: bool):
+    with self._lock:
+      self.stats["audited"] += 1
+      self.stats["agreed"] += agreed
+
+  def report(self) -> Dict[str, float]:
+    with self._lock:
+      stats = dict(self.stats)
+    answers = stats.get("answers", 0)
+    audited = stats.get("audited", 0)
+    return {
+      "answers": answers,
+      "pregraded": stats.get("pregraded", 0),
+      "escalated": stats.get("escalated", 0),
+      "escalation_rate": stats.get("escalated", 0) / answers if answers else 0.0,
+      "audited": audited,
+      "agreement": stats.get("agreed", 0) / audited if audited else 0.0,
+    }
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+from retrieval import CACHE_DIR, content_hash
+
+BANK_PATH = os.getenv("QUESTIONNARE_BANK_PATH", os.path.join(CACHE_DIR, "questions.sqlite"))
+BANK_MAX_BYTES = int(float(os.getenv("QUESTIONNARE_BANK_MAX_MB", "64")) * 1024 * 1024)
+# Question lists older than this are regenerated, 0 keeps them forever
+BANK_MAX_AGE_DAYS = float(os.getenv("QUESTIONNARE_BANK_MAX_AGE_DAYS", "30"))
+
+
+class QuestionBank:
+  """
+  Generated question lists and their passages, stored in SQLite by document content hash,
+  model and generation options. Entries past max_age_days are dropped, then the least
+  recently used ones once the bank grows over max_bytes.
+  """
+
+  def __init__(self, path: str = BANK_PATH, max_bytes: int = BANK_MAX_BYTES, max_age_days: float = BANK_MAX_AGE_DAYS):
+    self.max_bytes = max_bytes
+    self.max_age = max_age_days * 24 * 3600
+    self._lock = threading.Lock()
+
+    directory = os.path.dirname(path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    self._conn = sqlite3.connect(path, check_same_thread=False)
+    self._conn.execute(
+      "CREATE TABLE IF NOT EXISTS questions ("
+      "key TEXT PRIMARY KEY, questions TEXT NOT NULL, size INTEGER NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL)"
+    )
+    self._conn.commit()
+
+  @staticmethod
+  def make_key(text: str, model: str, options: Dict) -> str:
+    payload = json.dumps({"content": content_hash(text), "model": model, "options": options}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+  def get(self, key: str) -> Optional[List[Dict]]:
+    with self._lock:
+      row = self._conn.execute("SELECT questions, created FROM questions WHERE key = ?", (key,)).fetchone()
+      if row is None:
+        return None
+      if self.max_age and time.time() - row[1] > self.max_age:
+        self._conn.execute("DELETE FROM questions WHERE key = ?", (key,))
+        self._conn.commit()
+        return None
+      self._conn.execute("UPDATE questions SET last_access = ? WHERE key = ?", (time.time(), key))
+      self._conn.commit()
+      return json.loads(row[0])
+
+  def put(self, key: str, questions: List[Dict]):
+    value = json.dumps(questions)
+    now = time.time()
+    with self._lock:
+      self._conn.execute(
+        "INSERT OR REPLACE INTO questions (key, questions, size, created, last_access) VALUES (?, ?, ?, ?, ?)",
+        (key, value, len(value.encode("utf-8")), now, now),
+      )
+      self._evict()
+      self._conn.commit()
+
+  def _evict(self):
+    if self.max_age:
+      self._conn.execute("DELETE FROM questions WHERE created < ?", (time.time() - self.max_age,))
+    total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM questions").fetchone()[0]
+    if total <= self.max_bytes:
+      return
+    for key, size in self._conn.execute("SELECT key, size FROM questions ORDER BY last_access").fetchall():
+      self._conn.execute("DELETE FROM questions WHERE key = ?", (key,))
+      total -= size
+      if total <= self.max_bytes:
+        break
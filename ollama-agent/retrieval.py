@@ -0,0 +1,91 @@
+import hashlib
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List
+
+CACHE_DIR = os.getenv("QUESTIONNARE_CACHE_DIR", ".cache")
+
+# Passage size in characters and number of passages sent with each grading prompt
+PASSAGE_CHARS = 800
+TOP_K = 3
+
+# Standard BM25 parameters
+K1 = 1.5
+B = 0.75
+
+
+def content_hash(text: str) -> str:
+  return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def tokenize(text: str) -> List[str]:
+  return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def split_passages(text: str, max_chars: int = PASSAGE_CHARS) -> List[Dict]:
+  """Splits text into passages of whole paragraphs (or sentences for long paragraphs), with their offsets."""
+  pieces = []
+  for match in re.finditer(r"\S(?:.*?)(?=\n\s*\n|\Z)", text, re.S):
+    if len(match.group()) <= max_chars:
+      pieces.append((match.start(), match.end()))
+      continue
+    for sentence in re.finditer(r"\S.*?(?:[.!?](?=\s)|\Z)", match.group(), re.S):
+      pieces.append((match.start() + sentence.start(), match.start() + sentence.end()))
+
+  passages = []
+  start = end = None
+  for piece_start, piece_end in pieces:
+    if start is not None and piece_end - start > max_chars:
+      passages.append({"start": start, "end": end, "text": text[start:end]})
+      start = None
+    if start is None:
+      start = piece_start
+    end = piece_end
+  if start is not None:
+    passages.append({"start": start, "end": end, "text": text[start:end]})
+  return passages
+
+
+class PassageIndex:
+  """BM25 index over the passages of one document, cached on disk by content hash."""
+
+  def __init__(self, passages: List[Dict], tokens: List[List[str]]):
+    self.passages = passages
+    self.term_counts = [Counter(passage_tokens) for passage_tokens in tokens]
+    self.lengths = [len(passage_tokens) for passage_tokens in tokens]
+    self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+    document_frequency = Counter(term for counts in self.term_counts for term in counts)
+    n = len(passages)
+    self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+
+  @classmethod
+  def for_text(cls, text: str) -> "PassageIndex":
+    path = os.path.join(CACHE_DIR, "passages", content_hash(text) + ".json")
+    try:
+      with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    except (OSError, ValueError):
+      passages = split_passages(text)
+      data = {"passages": passages, "tokens": [tokenize(passage["text"]) for passage in passages]}
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    return cls(data["passages"], data["tokens"])
+
+  def search(self, query: str, k: int = TOP_K) -> List[Dict]:
+    """Returns the k passages that best support query, in document order."""
+    terms = tokenize(query)
+    scores = []
+    for i, counts in enumerate(self.term_counts):
+      score = 0.0
+      for term in terms:
+        tf = counts.get(term)
+        if tf:
+          norm = K1 * (1 - B + B * self.lengths[i] / self.avg_length)
+          score += self.idf[term] * tf * (K1 + 1) / (tf + norm)
+      scores.append((score, i))
+    best = sorted(i for _, i in sorted(scores, reverse=True)[:k])
+    return [self.passages[i] for i in best]
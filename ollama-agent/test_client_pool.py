@@ -0,0 +1,171 @@
+import time
+import ollama
+import pytest
+from client_pool import ClientPool
+
+HOSTS = ["http://ollama-a:11434", "http://ollama-b:11434", "http://ollama-c:11434"]
+
+
+class StandInClient:
+  """Stands in for the ollama.Client of a host, counting calls and failing while down or partway through a stream."""
+
+  def __init__(self, url):
+    self.url = url
+    self.calls = 0
+    self.down = False
+    self.fail_stream_after = None
+
+  def chat(self, stream=False, **kwargs):
+    self.calls += 1
+    if self.down:
+      raise ConnectionError(f"{self.url} is down")
+    if stream:
+      return self._stream()
+    return {"message": {"content": self.url}}
+
+  def list(self):
+    if self.down:
+      raise ConnectionError(f"{self.url} is down")
+    return {"models": []}
+
+  def _stream(self):
+    for n in range(3):
+      if self.fail_stream_after == n:
+        raise ConnectionError(f"{self.url} dropped the stream")
+      yield {"message": {"content": f"{self.url}#{n}"}}
+
+
+def make_pool(**kwargs):
+  pool = ClientPool(HOSTS, **kwargs)
+  for host in pool.hosts:
+    host.client = StandInClient(host.url)
+  return pool
+
+
+def client(pool, url):
+  return next(host.client for host in pool.hosts if host.url == url)
+
+
+def served_by(response):
+  return response["message"]["content"]
+
+
+def chunk_host(stream):
+  return next(stream)["message"]["content"].split("#")[0]
+
+
+def test_routes_to_least_outstanding_host():
+  pool = make_pool()
+  # Streams stay outstanding on their hosts until they are consumed
+  busy = {chunk_host(pool.chat(stream=True)), chunk_host(pool.chat(stream=True))}
+  assert len(busy) == 2
+  # The third request goes to the only host without a stream in flight
+  assert served_by(pool.chat()) not in busy
+
+
+def test_ejects_host_after_failure_threshold():
+  pool = make_pool(failure_threshold=2, eject_seconds=60)
+  down = client(pool, HOSTS[0])
+  down.down = True
+
+  # Failed requests are retried on another host, so every call still succeeds
+  for _ in range(6):
+    assert served_by(pool.chat()) != HOSTS[0]
+  assert down.calls == 2
+  assert [host["ejected"] for host in pool.stats()] == [True, False, False]
+
+
+def test_ejected_host_recovers_after_health_check():
+  pool = make_pool(failure_threshold=1, eject_seconds=60)
+  down = client(pool, HOSTS[0])
+  down.down = True
+  pool.chat()
+  assert pool.stats()[0]["ejected"]
+
+  down.down = False
+  pool.health_check()
+  assert not pool.stats()[0]["ejected"]
+  assert HOSTS[0] in {served_by(pool.chat()) for _ in range(3)}
+
+
+def test_ejected_host_is_retried_once_eject_period_ends():
+  pool = make_pool(failure_threshold=1, eject_seconds=0.05)
+  down = client(pool, HOSTS[0])
+  down.down = True
+  pool.chat()
+  down.down = False
+  time.sleep(0.1)
+  assert HOSTS[0] in {served_by(pool.chat()) for _ in range(3)}
+  assert not pool.stats()[0]["ejected"]
+
+
+def test_client_errors_are_not_retried_or_counted():
+  pool = make_pool(failure_threshold=1)
+  calls = []
+
+  def invalid(**kwargs):
+    calls.append(kwargs)
+    raise ollama.ResponseError("model not found", 404)
+
+  for host in pool.hosts:
+    host.client.chat = invalid
+  with pytest.raises(ollama.ResponseError):
+    pool.chat()
+  assert len(calls) == 1
+  assert not any(host["ejected"] for host in pool.stats())
+
+
+def test_stream_failing_before_first_chunk_is_retried_on_another_host():
+  pool = make_pool()
+  affinity = "document"
+  preferred = served_by(pool.pinned(affinity).chat())
+  client(pool, preferred).fail_stream_after = 0
+
+  chunks = [chunk["message"]["content"] for chunk in pool.pinned(affinity).chat(stream=True)]
+  assert len(chunks) == 3
+  assert all(not chunk.startswith(preferred) for chunk in chunks)
+  assert all(host["outstanding"] == 0 for host in pool.stats())
+
+
+def test_stream_failing_after_first_chunk_is_not_retried():
+  pool = make_pool()
+  affinity = "document"
+  preferred = served_by(pool.pinned(affinity).chat())
+  client(pool, preferred).fail_stream_after = 1
+
+  stream = pool.pinned(affinity).chat(stream=True)
+  assert next(stream)["message"]["content"].startswith(preferred)
+  with pytest.raises(ConnectionError):
+    next(stream)
+  assert sum(host.client.calls for host in pool.hosts) == 2
+  assert all(host["outstanding"] == 0 for host in pool.stats())
+
+
+def test_affinity_keeps_a_document_on_one_host():
+  pool = make_pool()
+  for affinity in ("alpha", "beta", "gamma", "delta"):
+    hosts = {served_by(pool.pinned(affinity).chat()) for _ in range(5)}
+    assert len(hosts) == 1
+
+
+def test_affinity_spreads_documents_over_hosts():
+  pool = make_pool()
+  hosts = {served_by(pool.pinned(f"document-{n}").chat()) for n in range(30)}
+  assert hosts == set(HOSTS)
+
+
+def test_affinity_moves_off_an_ejected_host_and_back():
+  pool = make_pool(failure_threshold=1, eject_seconds=0.05)
+  affinity = "document"
+  preferred = served_by(pool.pinned(affinity).chat())
+  down = client(pool, preferred)
+  down.down = True
+
+  fallback = served_by(pool.pinned(affinity).chat())
+  assert fallback != preferred
+  # Still ejected, so the document stays on the same fallback host
+  assert {served_by(pool.pinned(affinity).chat()) for _ in range(3)} == {fallback}
+
+  down.down = False
+  time.sleep(0.1)
+  assert served_by(pool.pinned(affinity).chat()) == preferred